@@ -26,7 +26,7 @@ PACERs
 Please see https://github.com/yssl/PACERs for more information.
 '''
 
-import os, shutil, time, argparse, glob
+import os, shutil, time, argparse, glob, atexit, Queue
 import multiprocessing as mp
 
 from pacerslib.global_const import *
@@ -39,28 +39,38 @@ from pacerslib.unicode import *
 from pacerslib.version import *
 from pacerslib.process import *
 from pacerslib.submission import *
+from pacerslib.cache import *
+from pacerslib.jobserver import *
+from pacerslib.check import *
+from pacerslib.affinity import *
+from pacerslib.reference import *
+from pacerslib.workspace import *
+from pacerslib.stdinput import *
+from pacerslib.pipeline import *
+from pacerslib.pool import *
 
 ############################################
 # multi processing worker functions
 def worker_build(params):
-    numAllProjs, i, projInfo, q = params
-    buildRetCode, buildLog, buildVersion = buildOneProj(projInfo)
-    q.put([i, buildRetCode, buildLog, buildVersion])
-    printBuildResult(q.qsize(), numAllProjs, projInfo, buildRetCode, buildLog)
-
-def worker_run(params):
-    buildRetCode, numAllProjs, i, projInfo, timeOut, interpreterCmd, preShellCmd, q = params
-    if buildRetCode==0:
-        exitTypeList, stdoutStrList, stdInputList, cmdArgsList = runOneProj(projInfo, timeOut, interpreterCmd, preShellCmd)
-    else:
-        exitTypeList = [-1]
-        stdoutStrList = ['Due to the build error.']
-        stdInputList = ['']
-        cmdArgsList = ['']
-    q.put([i, exitTypeList, stdoutStrList, stdInputList, cmdArgsList])
-    printRunResult(q.qsize(), numAllProjs, projInfo, exitTypeList, stdoutStrList)
+    i, projInfo, args = params
+    startTime = time.time()
+    buildRetCode, buildLog, buildVersion = buildOneProj(projInfo, args)
+    buildTime = time.time()-startTime
+    return i, buildRetCode, spoolPayload(buildLog, args.spool_dir, args.spool_size*1024), buildVersion, buildTime
+
+def worker_run_task(params):
+    projIndex, caseIndex, stdInput, cmdArg, projInfo, timeOut, interpreterCmd, preShellCmd, outputLimits, spoolDir, spoolSize, cpu = params
+    exitType, stdoutStr, runStat = runOneTask(projInfo, caseIndex, stdInput, cmdArg, timeOut, interpreterCmd, preShellCmd, outputLimits, cpu)
+    return projIndex, caseIndex, exitType, spoolPayload(stdoutStr, spoolDir, spoolSize), runStat, cpu
 
 
+############################################
+# argparse type functions
+def nonNegativeInt(string):
+    value = int(string)
+    if value < 0:
+        raise argparse.ArgumentTypeError('%s is negative'%string)
+    return value
 
 if __name__=='__main__':
 
@@ -117,6 +127,18 @@ default is an empty string.
 |          |                         |   "1 2" (STD_INPUT[0]), "3 4" (STD_INPUT[1])|
 
 ''')
+    parser.add_argument('--std-input-file', nargs='+', default=None,
+                        help='''Specify STD_INPUT_FILE files to be used as STD_INPUT,
+one for each run in the same way as STD_INPUT.
+The stdin of target programs is the file itself, so large
+inputs are not copied through PACERs, and only the file name,
+size and the first bytes of each file are shown in the report.
+Overrides --std-input.
+default: None''')
+    parser.add_argument('--std-input-dir', default=None,
+                        help='''Same as --std-input-file with all files in STD_INPUT_DIR
+in the order of their names.
+default: None''')
     parser.add_argument('--cmd-args', nargs='+', default=[''],
                         help='''Specify CMD_ARGS to be used as the command line arguments
 of target programs. This option should be located after
@@ -158,12 +180,71 @@ For example,
   : Run each program 3 times: (1, a), (1, b), (1, c)
 
 ''')
+    parser.add_argument('--expected-output', nargs='+', default=None,
+                        help='''Specify EXPECTED_OUTPUT files, one for each run of a
+target program in the same order as STD_INPUT and CMD_ARGS.
+If the number of files is less than the number of runs,
+the last one is used for the remaining runs.
+If a single directory is given, all files in it are used
+in the order of their names.
+stdout of each run is compared with its expected output
+while the program is running, ignoring carriage returns
+and trailing whitespace. The program is killed soon after
+its output differs from the expected output or becomes
+longer than it (Linux/Unix only), and the result (pass, or
+fail with the offset of the first different byte) is shown
+in the Score column of the report.
+default: None''')
     parser.add_argument('--timeout', default=2., type=float,
                         help='''Each target program is killed when TIMEOUT(seconds)
 is reached. Useful for infinite loop cases.
 Setting zero seconds(--timeout 0) means unlimited execution time
 for each target program, which can be useful for GUI applications.
 default: 2.0''')
+    parser.add_argument('--reference',
+                        help='''Specify REFERENCE, an instructor solution in any form
+of a submission (a source file or a directory).
+PACERs builds and runs REFERENCE for each run case before
+building the submissions, and uses
+max(REFERENCE_TIMEOUT_FACTOR * run time of REFERENCE,
+    REFERENCE_TIMEOUT_FLOOR)
+as the timeout of the case instead of TIMEOUT. TIMEOUT is
+used for the cases REFERENCE fails to finish within it.
+The run time of REFERENCE is an idle-machine time: its cases
+are run one at a time before any build or run of the
+submissions (on the first run core with --pin-cores),
+whereas the submissions are run NUM_CORES at a time by
+RUN_ENGINE (and alongside builds with --pipeline).
+REFERENCE_TIMEOUT_FACTOR should leave room for that
+slowdown as well as for slower solutions.
+The timeout of each case is shown in the report.
+default: None''')
+    parser.add_argument('--reference-timeout-factor', default=3., type=float,
+                        help='''See --reference. default: 3.0''')
+    parser.add_argument('--reference-timeout-floor', default=1., type=float,
+                        help='''See --reference. default: 1.0''')
+    parser.add_argument('--build-timeout', default=0., type=float,
+                        help='''Each build is stopped when BUILD_TIMEOUT(seconds)
+is reached, and all its processes (cmake, make, compilers, ...)
+are killed. The build is marked as "build timed out" in the
+log and the report. Useful for Makefiles that wait for input
+or never finish.
+Setting zero seconds(--build-timeout 0) means unlimited build time.
+default: 0''')
+    parser.add_argument('--output-capture-size', default=1024, type=nonNegativeInt,
+                        help='''Only the first and last OUTPUT_CAPTURE_SIZE/2 KiB of
+stdout (and stderr) of each target program are kept in
+memory and in the report. The omitted middle part is
+replaced with a marker that shows the number of omitted
+and total bytes. Useful for programs stuck in a print loop.
+Setting zero(--output-capture-size 0) keeps all output.
+default: 1024''')
+    parser.add_argument('--output-kill-size', default=0, type=nonNegativeInt,
+                        help='''Each target program is killed as soon as it prints
+more than OUTPUT_KILL_SIZE KiB to stdout and stderr in total.
+(Linux/Unix only)
+Setting zero(--output-kill-size 0) means no limit.
+default: 0''')
     parser.add_argument('--run-only', action='store_true',
                     help='''When specified, run each target program without build.
 You may use it when you want change STD_INPUT without
@@ -179,11 +260,70 @@ PACERs runs programs in parallel by default. ''')
     parser.add_argument('--build-serial', action='store_true',
                         help='''When specified, build each target program in serial.
 PACERs builds programs in parallel by default. ''')
+    parser.add_argument('--run-engine', default='pool', choices=['pool', 'event-loop'],
+                        help='''Specify RUN_ENGINE that runs target programs in parallel.
+
+| Engine     | Meaning                                         |
+|------------|-------------------------------------------------|
+| pool       | Run each project in one of NUM_CORES worker     |
+|            | processes, which are created once for PACERs    |
+|            | and also build projects in parallel.            |
+|------------|-------------------------------------------------|
+| event-loop | Keep up to NUM_CORES target programs running    |
+|            | from the single PACERs process, which waits for |
+|            | all of them in one event loop. Saves the memory |
+|            | and fork cost of worker processes.              |
+|            | (Linux/Unix only)                               |
+
+default: pool''')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='''When specified, builds and runs share NUM_CORES worker
+processes instead of a build phase followed by a run phase.
+The runs of a project are started as soon as its build
+finishes, before the remaining builds, so that a slow build
+does not delay all runs. RUN_ENGINE is not used.
+Trades timing fidelity for latency: runs share the cpu cores
+with the remaining builds (and their make jobs with
+--build-jobserver), so run times and timeouts, including
+the ones derived from --reference, are less reproducible
+than without --pipeline. Not used with --build-serial,
+--run-serial, --run-only and --build-only.''')
+    parser.add_argument('--pipeline-affinity', action='store_true',
+                        help='''When specified with --pipeline, a worker runs the projects
+it has built before the others, while their files are still
+in the page cache.''')
+    parser.add_argument('--spool-size', default=0, type=int,
+                        help='''Specify SPOOL_SIZE(KiB). A build log or an output of a target
+program larger than SPOOL_SIZE is passed from a worker process
+to PACERs through a file in WORKSPACE_DIR instead of a pipe.
+Saves the memory and copies of pickling large outputs.
+Setting zero(--spool-size 0) means no spooling.
+Not used with --pipeline.
+default: 0''')
+    parser.add_argument('--python-fork-server', action='store_true',
+                        help='''When specified, python source files are run by a fork
+server: an interpreter started once with INTERPRETER_CMD,
+which forks a child for each run and executes the source
+file in it with runpy, instead of starting a new interpreter
+for each run. Saves the interpreter startup time of every run.
+Timeouts, exit codes and outputs are the same as usual.
+Not used with PRE_SHELL_CMD. (Linux only)''')
     parser.add_argument('--run-only-serial', action='store_true',
                         help='''Shortcut for --run-only --run-serial.''')
-    parser.add_argument('--num-cores', default=mp.cpu_count(), type=int,
+    parser.add_argument('--num-cores', default=None, type=int,
                         help='''Specify number of cpu cores used in building and running process.
-default: number of cpu cores in your machine.''')
+default: number of cpu cores in your machine
+(number of cpu cores PACERs is allowed to use with --pin-cores).''')
+    parser.add_argument('--pin-cores', action='store_true',
+                        help='''When specified, PACERs takes the cpu cores it is allowed
+to use (its affinity mask, which can be smaller than the
+number of cpu cores in your machine under taskset, cgroups
+or containers), reserves the first one for itself and pins
+each concurrent run to one of the others, so that runs do
+not compete for cores. At most NUM_CORES-1 programs run at
+once. Makes run times and timeouts more reproducible.
+Builds are not pinned, but do not use the reserved core
+either. (Linux only)''')
     parser.add_argument('--no-report', action='store_true',
                         help='''When specified, the final report is not generated.''')
     parser.add_argument('--exclude-patterns', nargs='+', default=[''],
@@ -204,6 +344,43 @@ assignment_dir is /foo/bar/).''')
 and build output files to be generated. 
 Avoid including hangul characters in its full path.
 default: %s'''%'./output')
+    parser.add_argument('--workspace', default='output-dir', choices=['output-dir', 'tmpfs'],
+                        help='''Specify WORKSPACE where submissions are copied, built and run.
+
+| Workspace  | Meaning                                         |
+|------------|-------------------------------------------------|
+| output-dir | Work in OUTPUT_DIR/ASSIGNMENT_ALIAS, which keeps |
+|            | all copied submissions and build outputs.       |
+|------------|-------------------------------------------------|
+| tmpfs      | Work in a temporary directory in WORKSPACE_DIR, |
+|            | a RAM-backed file system, which is removed when |
+|            | PACERs exits. Only the report and the files     |
+|            | matching KEEP_FILES are written to OUTPUT_DIR.  |
+|            | Falls back to output-dir if the workspace may   |
+|            | not fit in WORKSPACE_BUDGET. Not used with      |
+|            | --run-only. (Linux/Unix only)                   |
+
+default: output-dir''')
+    parser.add_argument('--workspace-dir', default='/dev/shm',
+                        help='''Specify WORKSPACE_DIR, a directory in a RAM-backed
+file system for --workspace tmpfs and --spool-size.
+default: /dev/shm''')
+    parser.add_argument('--workspace-budget', default=0, type=int,
+                        help='''Specify WORKSPACE_BUDGET(MiB), the maximum memory the
+tmpfs workspace may take. PACERs estimates the size of the
+workspace as a few times the size of assignment_dir before
+copying it. Setting zero(--workspace-budget 0) means the
+free space of WORKSPACE_DIR.
+default: 0''')
+    parser.add_argument('--keep-files', nargs='+', default=[],
+                        help='''Files in the tmpfs workspace whose relative paths from
+the workspace match KEEP_FILES are copied to the same
+paths in OUTPUT_DIR/ASSIGNMENT_ALIAS before the workspace
+is removed. As in shell globs, * and ? do not match '/'.
+For example, "--keep-files pacers-build-*/*" keeps the files
+directly in the build directories of SINGLE_SOURCE_FILE
+submissions (executables and CMake files, not CMakeFiles/).
+default: None''')
     parser.add_argument('--interpreter-cmd', default='',
                         help='''Specify INTERPRETER_CMD that executes an interpreter
 for interpreted languages such as python.
@@ -212,6 +389,121 @@ default: \'python\' for python''')
                         help='''Specify PRE_SHELL_CMD that is executed before
 INTERPRETER_CMD or a target executable in the same shell.
 default: \'\' ''')
+    parser.add_argument('--single-source-builder', default='cmake', choices=['cmake', 'compiler', 'superproject'],
+                        help='''Specify SINGLE_SOURCE_BUILDER that builds each C/C++
+source file of SINGLE_SOURCE_FILE and SOURCE_FILES
+submissions.
+
+| Builder  | Meaning                                          |
+|----------|--------------------------------------------------|
+| cmake    | Generate a CMakeLists.txt for each source file,  |
+|          | then run cmake and make.                         |
+|----------|--------------------------------------------------|
+| compiler | Call C_COMPILER_CMD or CPP_COMPILER_CMD directly |
+|          | for each source file without CMake configuration,|
+|          | which is much faster for many small programs.    |
+|          | (Linux/Unix only)                                |
+|----------|--------------------------------------------------|
+| super-   | Generate one CMake project that has an executable|
+| project  | target for each source file, configure it once   |
+|          | and build all targets by make -jNUM_CORES.       |
+|          | Other projects are built as usual.               |
+|          | (Linux/Unix only)                                |
+
+default: cmake''')
+    parser.add_argument('--c-compiler-cmd', default='gcc',
+                        help='''Specify C_COMPILER_CMD used for .c files
+by --single-source-builder compiler.
+default: gcc''')
+    parser.add_argument('--cpp-compiler-cmd', default='g++',
+                        help='''Specify CPP_COMPILER_CMD used for .cpp, .cc, .cxx and .c++ files
+by --single-source-builder compiler.
+default: g++''')
+    parser.add_argument('--compiler-flags', default='',
+                        help='''Specify COMPILER_FLAGS passed to the compiler after
+the source file by --single-source-builder compiler.
+For example, --compiler-flags "-O2 -lm".
+default: \'\' ''')
+    parser.add_argument('--cmake-generator', default='auto', choices=['auto', 'make', 'ninja'],
+                        help='''Specify CMAKE_GENERATOR that builds CMAKE_PROJECT
+submissions and C/C++ source files built with CMake.
+
+| Generator | Meaning                                         |
+|-----------|-------------------------------------------------|
+| auto      | ninja if ninja is found in PATH, make otherwise.|
+|-----------|-------------------------------------------------|
+| make      | Configure with "Unix Makefiles" and build with  |
+|           | make.                                           |
+|-----------|-------------------------------------------------|
+| ninja     | Configure with -G Ninja and build with ninja,   |
+|           | which starts faster and schedules parallel jobs |
+|           | better than make. (Linux/Unix only)             |
+
+On Windows, NMake is always used.
+The build time of each project is printed and reported
+to compare generators.
+default: auto''')
+    parser.add_argument('--make-build-tree', default='link', choices=['link', 'copy'],
+                        help='''Specify how the build directory of each MAKE_PROJECT
+is populated from its submission directory, as make
+cannot build out of the source tree.
+
+| Mode | Meaning                                              |
+|------|------------------------------------------------------|
+| link | Reflink (copy-on-write clone) or hardlink each file, |
+|      | and copy only files that make is likely to write     |
+|      | (object files, libraries, executables) if they      |
+|      | cannot be reflinked. Much faster for submissions     |
+|      | with bundled libraries. A Makefile that modifies     |
+|      | its source files in place also modifies them in      |
+|      | OUTPUT_DIR (never in assignment_dir).                |
+|------|------------------------------------------------------|
+| copy | Copy all files.                                      |
+
+default: link''')
+    parser.add_argument('--share-cmake-compiler-id', action='store_true',
+                        help='''When specified, C/C++ compiler identification and
+ABI/feature checks are done by CMake only once, and their
+results are copied to the build directory of each
+CMAKE_PROJECT or single C/C++ source file before its
+configuration, which skips most of CMake configure time.
+Do not use it for CMAKE_PROJECT submissions that select
+their own compilers in CMakeLists.txt.''')
+    parser.add_argument('--precompile-headers', action='store_true',
+                        help='''When specified, the most frequent system header included
+first by C sources and by C++ sources (e.g. <bits/stdc++.h>)
+is precompiled once for each set of compiler flags with
+C_COMPILER_CMD or CPP_COMPILER_CMD (gcc-compatible only),
+and forced into the compilation of every single C/C++
+source file and CMAKE_PROJECT whose sources start with
+that header. Other sources are compiled normally.
+(Linux/Unix only)''')
+    parser.add_argument('--build-jobserver', action='store_true',
+                        help='''When specified, PACERs acts as a GNU make jobserver
+that has NUM_CORES job slots shared by all build workers
+and all make processes they start, so that a large
+CMAKE_PROJECT or MAKE_PROJECT can use idle cores (e.g. at
+the end of the build phase) without overloading the machine.
+Note that Makefiles that are not safe for parallel builds
+may fail with this option. (Linux/Unix only)''')
+    parser.add_argument('--dedup-projects', action='store_true',
+                        help='''When specified, projects with identical contents
+(e.g. unmodified starter code submitted by many students)
+are built and run only once. The other identical projects
+get the same build result, hardlinks to the same
+executable in their own build directories, and the same
+run results.''')
+    parser.add_argument('--build-cache-dir', default='',
+                        help='''Specify BUILD_CACHE_DIR in which build results are cached
+across PACERs invocations. A project whose source files,
+project files (CMakeLists.txt, Makefile, ...) and toolchain
+are unchanged since a previous build restores its executable
+and build log from the cache instead of being built again.
+Useful when re-grading an assignment with different
+STD_INPUT or a few late submissions.
+Avoid placing it in OUTPUT_DIR/ASSIGNMENT_ALIAS, which is
+deleted at every build.
+default: \'\' (no build cache)''')
 # parser.add_argument('--user-dict', default=None,
                     # help='''An alternative option to specify user input
 # which can be helpful for SOURCE_FILES submission type. 
@@ -249,6 +541,8 @@ default: \'\' ''')
     # unicode arguments
     gArgs.assignment_dir = toUnicode(gArgs.assignment_dir)
     gArgs.assignment_alias = toUnicode(gArgs.assignment_alias)
+    if gArgs.reference:
+        gArgs.reference = toUnicode(gArgs.reference)
 
     ############################################
     # main routine
@@ -261,6 +555,58 @@ default: \'\' ''')
     if gArgs.user_dict!=None:
         gArgs.user_dict = eval(gArgs.user_dict)
 
+    # set by the build phase
+    gArgs.jobserver_fds = None
+    gArgs.cmake_seed_dir = None
+    gArgs.precompiled_headers = None
+
+    gArgs.cmake_generator = resolveCMakeGenerator(gArgs.cmake_generator)
+
+    # (captureSize, killSize) in bytes
+    gArgs.output_limits = (gArgs.output_capture_size*1024, gArgs.output_kill_size*1024)
+
+    # resolve --pin-cores and --num-cores
+    gArgs.cpu_partition = None
+    gArgs.pool_cpus = None
+    if gArgs.pin_cores:
+        allowedCpus = getAllowedCpus()
+        if allowedCpus!=None and len(allowedCpus)>0:
+            if gArgs.num_cores==None:
+                gArgs.num_cores = len(allowedCpus)
+            gArgs.cpu_partition = getCpuPartition(max(gArgs.num_cores-1, 1))
+            # worker processes of the session pool stay off the cpu core reserved for PACERs
+            gArgs.pool_cpus = [cpu for cpu in allowedCpus if cpu!=gArgs.cpu_partition[0]]
+        else:
+            print 'PACERs: Unable to get the cpu cores PACERs is allowed to use. --pin-cores is ignored.'
+    if gArgs.num_cores==None:
+        gArgs.num_cores = mp.cpu_count()
+
+    # builds and runs are pipelined only if both of them are parallel
+    gArgs.pipeline = gArgs.pipeline and not (gArgs.build_serial or gArgs.run_serial or gArgs.run_only or gArgs.build_only)
+    if gArgs.pipeline and (gArgs.reference or gArgs.pin_cores):
+        print 'PACERs: Runs share the cpu cores with builds with --pipeline. Run times are less reproducible with --reference or --pin-cores.'
+
+    # large payloads from worker processes are spooled in gArgs.spool_dir
+    gArgs.spool_dir = None
+    if gArgs.spool_size>0:
+        gArgs.spool_dir = createSpoolDir(gArgs.workspace_dir)
+        atexit.register(removeSpoolDir, gArgs.spool_dir)
+
+    # load --std-input-file and --std-input-dir
+    if gArgs.std_input_file!=None or gArgs.std_input_dir!=None:
+        gArgs.std_input, errorMsg = loadStdInputFiles(gArgs.std_input_file, gArgs.std_input_dir)
+        if errorMsg!=None:
+            print 'PACERs: %s Please check --std-input-file or --std-input-dir again.'%errorMsg
+            exit()
+
+    # load --expected-output
+    gArgs.expected_output_paths = None
+    if gArgs.expected_output!=None:
+        gArgs.expected_output_paths, errorMsg = loadExpectedOutputPaths(gArgs.expected_output)
+        if errorMsg!=None:
+            print 'PACERs: %s Please check --expected-output again.'%errorMsg
+            exit()
+
     # check assignment_dir
     if not os.path.isdir(gArgs.assignment_dir):  
         print 'PACERs: Unable to access \'%s\'. Please check the assignment_dir again.'%gArgs.assignment_dir
@@ -275,7 +621,25 @@ default: \'\' ''')
     # copy assignment_dir to destDir(output_dir/assignment_alias)
     deco2unicoMap = {'':''}
     decodeAlias = unico2decoPath(gArgs.assignment_alias, deco2unicoMap)
-    destDir = opjoin(gArgs.output_dir, decodeAlias)
+    outputDestDir = opjoin(gArgs.output_dir, decodeAlias)
+    destDir = outputDestDir
+
+    # with --workspace tmpfs, destDir is in a temporary directory and outputDestDir only has the report and kept files
+    gArgs.workspace_path = None
+    if gArgs.workspace=='tmpfs':
+        if gArgs.run_only:
+            print 'PACERs: --run-only uses the build outputs in OUTPUT_DIR. The workspace is OUTPUT_DIR.'
+        else:
+            gArgs.workspace_path, errorMsg = createTmpfsWorkspace(gArgs.workspace_dir, gArgs.assignment_dir, gArgs.workspace_budget*(1<<20))
+            if errorMsg!=None:
+                print 'PACERs: %s The workspace is OUTPUT_DIR.'%errorMsg
+            else:
+                atexit.register(removeWorkspace, gArgs.workspace_path)
+                destDir = opjoin(gArgs.workspace_path, decodeAlias)
+                print '%sWorking in the tmpfs workspace \'%s\'...'%(gLogPrefix, gArgs.workspace_path)
+                if os.path.exists(outputDestDir):
+                    shutil.rmtree(toString(outputDestDir))
+                os.makedirs(toString(outputDestDir))
 
     if not gArgs.run_only:
         print '%sCopying all submissions from \'%s\' to \'%s\'...'%(gLogPrefix, gArgs.assignment_dir, destDir)
@@ -300,37 +664,125 @@ default: \'\' ''')
         except OSError:
             pass
 
+    # fingerprint the toolchain once for build cache keys
+    if gArgs.build_cache_dir and not gArgs.run_only:
+        gArgs.build_cache_dir = os.path.abspath(gArgs.build_cache_dir)
+        gArgs.toolchain_hash = getToolchainHash(gArgs)
+
+    # build and run the reference to derive the timeout of each run case
+    gArgs.reference_timeouts = None
+    if gArgs.reference:
+        print '%sCalibrating timeouts with the reference \'%s\'...'%(gLogPrefix, gArgs.reference)
+        refProjInfo, errorMsg = collectReferenceProjInfo(gArgs.reference, opjoin(destDir, gReferenceDirName), gArgs.exclude_patterns, gArgs.std_input, gArgs.cmd_args, deco2unicoMap)
+        if errorMsg!=None:
+            print 'PACERs: %s Please check --reference again.'%errorMsg
+            exit()
+        if not gArgs.run_only:
+            buildRetCode, buildLog, buildVersion = buildOneProj(refProjInfo, gArgs)
+            printBuildResult(1, 1, refProjInfo, buildRetCode, buildLog)
+            if buildRetCode!=0:
+                print 'PACERs: Unable to build the reference. Please check --reference again.'
+                exit()
+        resolveRunCmdAndCwd(refProjInfo, gArgs.interpreter_cmd, gArgs.python_fork_server)
+        exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList = runOneProj(refProjInfo, gArgs.timeout, gArgs.interpreter_cmd, gArgs.pre_shell_cmd, gArgs.output_limits,
+                                                                                         gArgs.cpu_partition[1][0] if gArgs.cpu_partition!=None else None)
+        printRunResult(1, 1, refProjInfo, exitTypeList, stdoutStrList, runStatList)
+        gArgs.reference_timeouts = getReferenceTimeOuts(exitTypeList, runStatList, gArgs.timeout, gArgs.reference_timeout_factor, gArgs.reference_timeout_floor)
+        for caseIndex in range(len(gArgs.reference_timeouts)):
+            print '%s%s'%(gLogPrefix, getReferenceTimeOutStr(caseIndex, gArgs.reference_timeouts[caseIndex]))
+
     # collect all project info
     allProjInfos = collectAllProjInfosInAllSubmissions(submissionTitles, gArgs.assignment_dir, gArgs.exclude_patterns, gArgs.std_input, gArgs.cmd_args, destDir, deco2unicoMap)
 
+    # find identical projects. only the first one of them (representative) is built and run.
+    if gArgs.dedup_projects:
+        dedupReps = getDedupRepresentatives(allProjInfos)
+        print '%sFound %d identical projects out of %d projects.'%(gLogPrefix, len([i for i in range(len(allProjInfos)) if dedupReps[i]!=i]), len(allProjInfos))
+    else:
+        dedupReps = range(len(allProjInfos))
+    repIndices = [i for i in range(len(allProjInfos)) if dedupReps[i]==i]
+    dupIndices = [i for i in range(len(allProjInfos)) if dedupReps[i]!=i]
+
     printLogPrefixDescription()
 
     # build projects one by one
     buildResults = [None]*len(allProjInfos)
+    # None if the build time of a project is unknown
+    buildTimes = [None]*len(allProjInfos)
     if not gArgs.run_only:
-        if not gArgs.build_serial:
+        buildIndices = repIndices
+
+        # identify the toolchain once for all CMake configures
+        if gArgs.share_cmake_compiler_id:
+            print '%sIdentifying C/C++ compilers for CMake...'%gLogPrefix
+            gArgs.cmake_seed_dir = prepareCMakeCompilerIdSeed(opjoin(destDir, gCMakeProbeDirName), gArgs)
+            if gArgs.cmake_seed_dir==None:
+                print '%sFailed to identify compilers. Each CMake configure identifies them.'%gLogPrefix
+
+        # precompile the most frequent leading system headers
+        if gArgs.precompile_headers:
+            print '%sPrecompiling frequently included headers...'%gLogPrefix
+            gArgs.precompiled_headers = buildPrecompiledHeaders([allProjInfos[i] for i in repIndices], opjoin(destDir, gPchDirName), gArgs)
+            for language in sorted(gArgs.precompiled_headers):
+                print '%sPrecompiled <%s> for %s sources.'%(gLogPrefix, gArgs.precompiled_headers[language][0], language.upper())
+
+        # create the jobserver before starting build workers so that they inherit it
+        if gArgs.build_jobserver:
+            gArgs.jobserver_fds = createJobServer(gArgs.num_cores)
+
+        # build all single source C/C++ projects at once
+        if gArgs.single_source_builder=='superproject':
+            print 
+            print '%sBuilding single source projects in a CMake superproject with %d cores...'%(gLogPrefix, gArgs.num_cores)
+            print
+            superprojectDir = opjoin(destDir, gSuperprojectDirName)
+            superResults = buildSingleSourceSuperproject([allProjInfos[i] for i in repIndices], superprojectDir, gArgs)
+            buildIndices = []
+            for count, i in enumerate(repIndices):
+                if superResults[count]!=None:
+                    buildResults[i] = list(superResults[count])
+                    printBuildResult(count-len(buildIndices)+1, len(allProjInfos), allProjInfos[i], buildResults[i][0], buildResults[i][1])
+                else:
+                    buildIndices.append(i)
+        numBuiltProjs = len(repIndices)-len(buildIndices)
+
+        if gArgs.pipeline:
+            # buildIndices are built by runPipeline() with the runs
+            pass
+        elif not gArgs.build_serial:
             print 
             print '%sBuilding projects in parallel with %d cores...'%(gLogPrefix, gArgs.num_cores)
             print
-            p = mp.Pool(gArgs.num_cores)
-            q = mp.Manager().Queue()
-            p.map(worker_build, [(len(allProjInfos), i, allProjInfos[i], q) for i in range(len(allProjInfos))])
-            while not q.empty():
-                i, buildRetCode, buildLog, buildVersion = q.get()
+            p = getSessionPool(gArgs.num_cores, gArgs.pool_cpus)
+            for count, (i, buildRetCode, buildLog, buildVersion, buildTime) in enumerate(p.imap_unordered(worker_build,
+                    [(i, allProjInfos[i], gArgs) for i in buildIndices], getChunkSize(len(buildIndices), gArgs.num_cores))):
+                buildLog = unspoolPayload(buildLog)
                 buildResults[i] = [buildRetCode, buildLog, buildVersion]
+                buildTimes[i] = buildTime
+                printBuildResult(numBuiltProjs+count+1, len(allProjInfos), allProjInfos[i], buildRetCode, buildLog, buildTime)
         else:
             print 
             print '%sBuilding projects in serial...'%gLogPrefix
             print
-            for i in range(len(allProjInfos)):
-                printBuildStart(i+1, len(allProjInfos), allProjInfos[i])
-                buildRetCode, buildLog, buildVersion = buildOneProj(allProjInfos[i])
+            for count, i in enumerate(buildIndices):
+                printBuildStart(numBuiltProjs+count+1, len(allProjInfos), allProjInfos[i])
+                startTime = time.time()
+                buildRetCode, buildLog, buildVersion = buildOneProj(allProjInfos[i], gArgs)
+                buildTimes[i] = time.time()-startTime
 
                 # # for debugging
                 # print buildLog
 
                 buildResults[i] = [buildRetCode, buildLog, buildVersion]
-                printBuildResult(i+1, len(allProjInfos), allProjInfos[i], buildRetCode, buildLog)
+                printBuildResult(numBuiltProjs+count+1, len(allProjInfos), allProjInfos[i], buildRetCode, buildLog, buildTimes[i])
+
+        if not gArgs.pipeline:
+            # share build results of representatives with their duplicates
+            for count, i in enumerate(dupIndices):
+                buildResults[i] = list(shareBuildResult(allProjInfos[dedupReps[i]], allProjInfos[i], buildResults[dedupReps[i]]))
+                printBuildResult(len(repIndices)+count+1, len(allProjInfos), allProjInfos[i], buildResults[i][0], buildResults[i][1])
+
+            closeJobServer(gArgs.jobserver_fds)
     else:
         for i in range(len(allProjInfos)):
             buildResults[i] = [0, '', 'no-build-version']
@@ -338,37 +790,147 @@ default: \'\' ''')
     # run projects one by one
     runResults = [None]*len(allProjInfos)
     if not gArgs.build_only:
-        if not gArgs.run_serial:
+        # the number of concurrent runs
+        numRunSlots = gArgs.num_cores
+        if gArgs.cpu_partition!=None:
+            coordinatorCpu, runCpus = gArgs.cpu_partition
+            numRunSlots = len(runCpus)
+            if coordinatorCpu!=None:
+                setCpuAffinity(0, [coordinatorCpu])
+            print
+            print '%sPinning cpu cores (%s)...'%(gLogPrefix, getCpuPartitionStr(gArgs.cpu_partition))
+
+        # find the executable of each project once, not for every run
+        def prepareRun(i):
+            resolveRunCmdAndCwd(allProjInfos[i], gArgs.interpreter_cmd, gArgs.python_fork_server)
+            allProjInfos[i]['expectedOutputPaths'] = gArgs.expected_output_paths
+            if gArgs.reference_timeouts!=None:
+                allProjInfos[i]['timeOuts'] = [referenceTimeOut['timeOut'] for referenceTimeOut in gArgs.reference_timeouts]
+        for i in repIndices:
+            # buildResults[i] is None until runPipeline() builds it
+            if buildResults[i]!=None and buildResults[i][0]==0:
+                prepareRun(i)
+
+        if gArgs.pipeline:
+            # projects built by the superproject are run from the start
+            runIndices = []
+            for i in repIndices:
+                if buildResults[i]==None:
+                    continue
+                if buildResults[i][0]==0:
+                    runIndices.append(i)
+                else:
+                    runResults[i] = [[-1], ['Due to the build error.'], [''], [''], [None]]
+                    printRunResult(len([r for r in runResults if r!=None]), len(allProjInfos), allProjInfos[i], runResults[i][0], runResults[i][1])
+
+            def onPipelineBuildFinished(i, buildRetCode, buildLog, buildVersion, buildTime):
+                buildResults[i] = [buildRetCode, buildLog, buildVersion]
+                buildTimes[i] = buildTime
+                printBuildResult(len([r for r in buildResults if r!=None]), len(allProjInfos), allProjInfos[i], buildRetCode, buildLog, buildTime)
+                if buildRetCode!=0:
+                    runResults[i] = [[-1], ['Due to the build error.'], [''], [''], [None]]
+                    printRunResult(len([r for r in runResults if r!=None]), len(allProjInfos), allProjInfos[i], runResults[i][0], runResults[i][1])
+                    return False
+                prepareRun(i)
+                return True
+
+            def onPipelineProjFinished(i, exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList):
+                runResults[i] = [exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList]
+                printRunResult(len([r for r in runResults if r!=None]), len(allProjInfos), allProjInfos[i], exitTypeList, stdoutStrList, runStatList)
+
             print 
-            print '%sRunning projects in parallel with %d cores...'%(gLogPrefix, gArgs.num_cores)
+            print '%sBuilding and running projects in a pipeline with %d cores...'%(gLogPrefix, numRunSlots)
             print
-            p = mp.Pool(gArgs.num_cores)
-            q = mp.Manager().Queue()
-            p.map(worker_run, [(buildResults[i][0], len(allProjInfos), i, allProjInfos[i], gArgs.timeout, gArgs.interpreter_cmd, gArgs.pre_shell_cmd, q) for i in range(len(allProjInfos))])
-            while not q.empty():
-                i, exitTypeList, stdoutStrList, stdInputList, cmdArgsList = q.get()
-                runResults[i] = [exitTypeList, stdoutStrList, stdInputList, cmdArgsList]
+            runPipeline(allProjInfos, buildIndices, runIndices, gArgs, numRunSlots, gArgs.pipeline_affinity, onPipelineBuildFinished, onPipelineProjFinished,
+                        gArgs.cpu_partition[1] if gArgs.cpu_partition!=None else None)
+
+            # share build results of representatives with their duplicates
+            for count, i in enumerate(dupIndices):
+                buildResults[i] = list(shareBuildResult(allProjInfos[dedupReps[i]], allProjInfos[i], buildResults[dedupReps[i]]))
+                printBuildResult(len(repIndices)+count+1, len(allProjInfos), allProjInfos[i], buildResults[i][0], buildResults[i][1])
+
+            closeJobServer(gArgs.jobserver_fds)
+
+        elif not gArgs.run_serial:
+            # projects with build errors are not run
+            runIndices = []
+            for i in repIndices:
+                if buildResults[i][0]==0:
+                    runIndices.append(i)
+                else:
+                    runResults[i] = [[-1], ['Due to the build error.'], [''], [''], [None]]
+                    printRunResult(len([r for r in runResults if r!=None]), len(allProjInfos), allProjInfos[i], runResults[i][0], runResults[i][1])
+
+            def onProjFinished(index, exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList):
+                i = runIndices[index]
+                runResults[i] = [exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList]
+                printRunResult(len([r for r in runResults if r!=None]), len(allProjInfos), allProjInfos[i], exitTypeList, stdoutStrList, runStatList)
+
+            if gArgs.run_engine=='event-loop' and os.name=='posix':
+                print 
+                print '%sRunning projects in an event loop with %d concurrent runs...'%(gLogPrefix, numRunSlots)
+                print
+                runProjsInEventLoop([allProjInfos[i] for i in runIndices], gArgs.timeout, gArgs.interpreter_cmd, gArgs.pre_shell_cmd, gArgs.output_limits, numRunSlots, onProjFinished,
+                                    gArgs.cpu_partition[1] if gArgs.cpu_partition!=None else None)
+            else:
+                print 
+                print '%sRunning projects in parallel with %d cores...'%(gLogPrefix, numRunSlots)
+                print
+                # each run (a project with one of its inputs) is a separate task
+                runTasks, projStates = makeRunTasksAndProjStates([allProjInfos[i] for i in runIndices])
+                for index in range(len(runIndices)):
+                    if isProjStateFinished(projStates[index]):
+                        onProjFinished(index, *getProjStateRunResult(projStates[index]))
+                # with --pin-cores, each run takes one of the run cpus and at most numRunSlots runs are in flight
+                freeCpus = None
+                chunkSize = getChunkSize(len(runTasks), numRunSlots)
+                if gArgs.cpu_partition!=None:
+                    freeCpus = Queue.Queue()
+                    for cpu in gArgs.cpu_partition[1]:
+                        freeCpus.put(cpu)
+                    chunkSize = 1
+                p = getSessionPool(gArgs.num_cores, gArgs.pool_cpus)
+                for index, caseIndex, exitType, stdoutStr, runStat, cpu in p.imap_unordered(worker_run_task,
+                        iterCpuGatedTasks([(index, caseIndex, stdInput, cmdArg, allProjInfos[runIndices[index]], gArgs.timeout, gArgs.interpreter_cmd, gArgs.pre_shell_cmd, gArgs.output_limits,
+                                            gArgs.spool_dir, gArgs.spool_size*1024) for index, caseIndex, stdInput, cmdArg in runTasks], freeCpus), chunkSize):
+                    if cpu!=None:
+                        freeCpus.put(cpu)
+                    if addRunTaskResult(projStates[index], caseIndex, exitType, unspoolPayload(stdoutStr), runStat):
+                        onProjFinished(index, *getProjStateRunResult(projStates[index]))
         else:
             print 
             print '%sRunning projects in serial...'%gLogPrefix
             print
-            for i in range(len(allProjInfos)):
-                printRunStart(i+1, len(allProjInfos), allProjInfos[i])
+            for count, i in enumerate(repIndices):
+                printRunStart(count+1, len(allProjInfos), allProjInfos[i])
                 if buildResults[i][0]==0:
-                    exitTypeList, stdoutStrList, stdInputList, cmdArgsList = runOneProj(allProjInfos[i], gArgs.timeout, gArgs.interpreter_cmd, gArgs.pre_shell_cmd)
+                    exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList = runOneProj(allProjInfos[i], gArgs.timeout, gArgs.interpreter_cmd, gArgs.pre_shell_cmd, gArgs.output_limits,
+                                                                                                     gArgs.cpu_partition[1][0] if gArgs.cpu_partition!=None else None)
                 else:
                     exitTypeList = [-1]
                     stdoutStrList = ['Due to build error.']
                     stdInputList = ['']
                     cmdArgsList = ['']
-                runResults[i] = [exitTypeList, stdoutStrList, stdInputList, cmdArgsList]
-                printRunResult(i+1, len(allProjInfos), allProjInfos[i], exitTypeList, stdoutStrList)
+                    runStatList = [None]
+                runResults[i] = [exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList]
+                printRunResult(count+1, len(allProjInfos), allProjInfos[i], exitTypeList, stdoutStrList, runStatList)
+
+        # identical projects (same executable, stdin and arguments) share the run results of their representatives
+        for count, i in enumerate(dupIndices):
+            if buildResults[i][0]==buildResults[dedupReps[i]][0]:
+                runResults[i] = runResults[dedupReps[i]]
+            else:
+                # sharing the build result has failed
+                runResults[i] = [[-1], ['Due to build error.'], [''], [''], [None]]
+            printRunResult(len(repIndices)+count+1, len(allProjInfos), allProjInfos[i], runResults[i][0], runResults[i][1])
     else:
         for i in range(len(allProjInfos)):
-            runResults[i] = [[-1], [''], [''], ['']]
+            runResults[i] = [[-1], [''], [''], [''], [None]]
+
+    closeSessionPool()
 
     # generate report data
-    submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, stdInputLists, cmdArgsLists, submissionTypes, buildVersionSet = \
+    submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, stdInputLists, cmdArgsLists, submissionTypes, buildVersionSet, runStatLists = \
             generateReportDataForAllProjs(allProjInfos, buildResults, runResults, destDir, gArgs, deco2unicoMap)
 
     print
@@ -376,7 +938,13 @@ default: \'\' ''')
     if not gArgs.no_report:
         print '%sGenerating Report for %s...'%(gLogPrefix, gArgs.assignment_alias)
         generateReport(gArgs, submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists,
-                stdInputLists, cmdArgsLists, submissionTypes, buildVersionSet)
+                stdInputLists, cmdArgsLists, submissionTypes, buildVersionSet, buildTimes, runStatLists)
+
+    if gArgs.workspace_path!=None:
+        print '%sThe tmpfs workspace took %d MiB.'%(gLogPrefix, getDirSize(gArgs.workspace_path)/(1<<20))
+        if len(gArgs.keep_files)>0:
+            numKeptFiles = keepWorkspaceFiles(destDir, outputDestDir, gArgs.keep_files)
+            print '%sKept %d files of the workspace in \'%s\'.'%(gLogPrefix, numKeptFiles, outputDestDir)
 
     removeUnzipDirsInAssignDir(gArgs.assignment_dir, unzipDirNames)
     print '%sDone.'%gLogPrefix
@@ -0,0 +1,80 @@
+################################################################################
+# affinity.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, sys, ctypes, ctypes.util
+
+############################################
+# CPU affinity functions (Linux only)
+# With --pin-cores, the run phase is split over the CPUs PACERs is allowed to use (its affinity mask,
+# which can be smaller than cpu_count() under taskset, cgroups or containers):
+# the first CPU is reserved for PACERs itself, and each concurrent run gets one of the others,
+# so target programs do not compete with each other or with PACERs for a core.
+# cpuPartition: (coordinatorCpu, runCpus) - coordinatorCpu is None if there is only one allowed CPU.
+
+gCpuSetSize = 1024  # CPU_SETSIZE of glibc
+gNumCpuMaskWords = gCpuSetSize / (8*ctypes.sizeof(ctypes.c_ulong))
+
+gLibc = None
+
+def getLibc():
+    global gLibc
+    if gLibc==None:
+        gLibc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    return gLibc
+
+def isCpuAffinitySupported():
+    return sys.platform.startswith('linux')
+
+def getAllowedCpus():
+    # return the sorted list of CPUs this process may run on, or None if unknown
+    if not isCpuAffinitySupported():
+        return None
+    mask = (ctypes.c_ulong*gNumCpuMaskWords)()
+    try:
+        if getLibc().sched_getaffinity(0, ctypes.sizeof(mask), mask)!=0:
+            return None
+    except (OSError, AttributeError):
+        return None
+    bitsPerWord = 8*ctypes.sizeof(ctypes.c_ulong)
+    return [cpu for cpu in range(gCpuSetSize) if mask[cpu/bitsPerWord] & (1 << (cpu%bitsPerWord))]
+
+def setCpuAffinity(pid, cpus):
+    # pin the process pid (0 for this process) to cpus. return False if it fails.
+    if not isCpuAffinitySupported():
+        return False
+    mask = (ctypes.c_ulong*gNumCpuMaskWords)()
+    bitsPerWord = 8*ctypes.sizeof(ctypes.c_ulong)
+    for cpu in cpus:
+        mask[cpu/bitsPerWord] |= 1 << (cpu%bitsPerWord)
+    try:
+        return getLibc().sched_setaffinity(pid, ctypes.sizeof(mask), mask)==0
+    except (OSError, AttributeError):
+        return False
+
+def getCpuPartition(numRunCpus):
+    # return cpuPartition with at most numRunCpus run CPUs, or None if CPU affinity is not supported
+    allowedCpus = getAllowedCpus()
+    if allowedCpus==None or len(allowedCpus)==0:
+        return None
+    if len(allowedCpus)==1:
+        return None, allowedCpus
+    return allowedCpus[0], allowedCpus[1:1+numRunCpus]
+
+def getCpuPartitionStr(cpuPartition):
+    coordinatorCpu, runCpus = cpuPartition
+    return 'PACERs: %s, runs: %s'%('-' if coordinatorCpu==None else coordinatorCpu, ','.join([str(cpu) for cpu in runCpus]))
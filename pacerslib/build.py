@@ -16,17 +16,62 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
-import os, subprocess, glob, shutil
+import os, subprocess, glob, shutil, time
+from distutils.spawn import find_executable
 from global_const import *
 from unicode import *
+from cache import *
+from file import *
+from jobserver import *
+from buildcmd import *
+from pch import *
+from supervisor import *
 
-def buildOneProj(projInfo):
+def buildOneProj(projInfo, args):
     submissionType = projInfo['submissionType']
     projName = projInfo['projName']
     submissionDir = projInfo['submissionDir']
     filesInProj = projInfo['filesInProj']
 
-    buildRetCode, buildLog, buildVersion = buildProj(submissionType, submissionDir, projName, filesInProj)
+    buildHash = None
+    if args.build_cache_dir:
+        buildHash = getBuildHash(projInfo, args)
+        if buildHash!=None:
+            cachedResult = loadCachedBuild(projInfo, args.build_cache_dir, buildHash)
+            if cachedResult!=None:
+                return cachedResult
+
+    jobServerState = beginJobServerBuild(args.jobserver_fds)
+    try:
+        buildRetCode, buildLog, buildVersion = buildProj(submissionType, submissionDir, projName, filesInProj, args)
+    finally:
+        endJobServerBuild(args.jobserver_fds, jobServerState)
+
+    if buildHash!=None:
+        storeCachedBuild(projInfo, args.build_cache_dir, buildHash, buildRetCode, buildLog, buildVersion)
+
+    return buildRetCode, buildLog, buildVersion
+
+def shareBuildResult(srcProjInfo, dstProjInfo, srcBuildResult):
+    # give dstProjInfo, which is identical to the already built srcProjInfo, the same build result
+    # by hardlinking the build outputs of srcProjInfo into the build dir of dstProjInfo.
+    srcBuildDir = opjoin(srcProjInfo['submissionDir'], gBuildDirPrefix+srcProjInfo['projName'])
+    dstBuildDir = opjoin(dstProjInfo['submissionDir'], gBuildDirPrefix+dstProjInfo['projName'])
+    buildRetCode, buildLog, buildVersion = srcBuildResult
+
+    if buildRetCode==0:
+        try:
+            if not os.path.isdir(dstBuildDir):
+                os.makedirs(dstBuildDir)
+            for name in getBuildOutputNames(srcBuildDir):
+                # the executable of a single source file is named after its project name
+                if dstProjInfo['submissionType']==SINGLE_SOURCE_FILE and name==srcProjInfo['projName']:
+                    dstName = dstProjInfo['projName']
+                else:
+                    dstName = name
+                linkOrCopyFile(opjoin(srcBuildDir, name), opjoin(dstBuildDir, dstName))
+        except (IOError, OSError) as e:
+            return -1, toUnicode(str(e)), buildVersion
 
     return buildRetCode, buildLog, buildVersion
 
@@ -35,55 +80,89 @@ def buildOneProj(projInfo):
 # return buildRetCode, buildLog, buildVersion
 # buildRetCode:
 #   -1 - build failed due to internal error, not because build error (not supported extension, etc)
+#   -2 (gBuildTimeoutRetCode) - build was killed due to --build-timeout
 #   0 - build succeeded
 #   else - build failed due to build error
 # buildVersion:
 #   cmake-version
+#   compiler-version
+#   make-version
 #   visual-cpp-version
 
-def buildProj(submissionType, submissionDir, projName, projSrcFileNames):
+def buildProj(submissionType, submissionDir, projName, projSrcFileNames, args):
     if submissionType==SINGLE_SOURCE_FILE or submissionType==SOURCE_FILES:
-        buildRetCode, buildLog, buildVersion = build_single_source(submissionDir, projName, projSrcFileNames[0])
+        buildRetCode, buildLog, buildVersion = build_single_source(submissionDir, projName, projSrcFileNames[0], args)
     elif submissionType==CMAKE_PROJECT:
-        buildRetCode, buildLog, buildVersion = build_cmake(submissionDir, projName)
+        buildRetCode, buildLog, buildVersion = build_cmake(submissionDir, projName, projSrcFileNames, args)
     elif submissionType==MAKE_PROJECT:
-        buildRetCode, buildLog, buildVersion = build_make(submissionDir, projName)
+        buildRetCode, buildLog, buildVersion = build_make(submissionDir, projName, args)
     elif submissionType==VISUAL_CPP_PROJECT:
-        buildRetCode, buildLog, buildVersion = build_vcxproj(submissionDir, projName)
+        buildRetCode, buildLog, buildVersion = build_vcxproj(submissionDir, projName, args)
     return buildRetCode, buildLog, buildVersion
 
 ####
 # build_single functions
-def build_single_source(srcRootDir, projName, singleSrcFileName):
+def build_single_source(srcRootDir, projName, singleSrcFileName, args):
     extension = os.path.splitext(singleSrcFileName)[1].lower()
     if extension in gSourceExt:
         build_single_func = eval(gSourceExt[extension]['build-single-source-func'])
     else:
         build_single_func = build_single_else
-    return build_single_func(srcRootDir, projName, singleSrcFileName)
+    return build_single_func(srcRootDir, projName, singleSrcFileName, args)
+
+def build_single_c_cpp(srcRootDir, projName, singleSrcFileName, args):
+    if args.single_source_builder=='compiler':
+        buildVersion = 'compiler-version'
+    else:
+        buildVersion = 'cmake-version'
 
-def build_single_c_cpp(srcRootDir, projName, singleSrcFileName):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
     try:
         os.makedirs(buildDir)
     except Exception as e:
-        return -1, toUnicode(str(e)), 'cmake-version'
+        return -1, toUnicode(str(e)), buildVersion
+
+    language = getSourceLanguage(singleSrcFileName)
+    if args.single_source_builder=='compiler':
+        if language=='c':
+            compilerCmd = args.c_compiler_cmd
+        else:
+            compilerCmd = args.cpp_compiler_cmd
+        pchHeaderPath = getPchHeaderPath(args.precompiled_headers, language, [opjoin(srcRootDir, singleSrcFileName)], args.compiler_flags)
+        compilerFlags = (args.compiler_flags+' '+getPchCompilerFlag(pchHeaderPath)).strip()
+        return __build_compiler(buildDir, '../%s'%singleSrcFileName, projName, compilerCmd, compilerFlags, args)
 
     makeCMakeLists_single_c_cpp(projName, singleSrcFileName, buildDir)
 
-    return __build_cmake(buildDir, './')
+    pchCMakeArgs = getPchCMakeArgs(args.precompiled_headers, [(language, opjoin(srcRootDir, singleSrcFileName))], '')
+    return __build_cmake(buildDir, './', args, pchCMakeArgs)
 
-def build_single_py(srcRootDir, projName, singleSrcFileName):
+def build_single_py(srcRootDir, projName, singleSrcFileName, args):
     return 0, '', 'python-version'
 
-def build_single_else(srcRootDir, projName, singleSrcFileName):
+def build_single_else(srcRootDir, projName, singleSrcFileName, args):
     extension = os.path.splitext(singleSrcFileName)[1].lower()
     errorMsg = u'Building %s is not supported.'%extension
     return -1, errorMsg, 'no-build-version'
 
+####
+# build_compiler functions
+def __build_compiler(buildDir, srcFileFromBuildDir, execName, compilerCmd, compilerFlags, args):
+    # build a single source file by a direct compiler call, without CMake configuration.
+    # flags are placed after the source file so that libraries (e.g. -lm) can be given.
+    if os.name!='posix':
+        return -1, 'Building with --single-source-builder compiler is not supported on Windows', 'compiler-version'
+    compileCmd = gOSEnv[os.name]['compiler-cmd'](compilerCmd, srcFileFromBuildDir, execName, compilerFlags)
+    try:
+        buildLog = toUnicode(compileCmd+'\n') + toUnicode(checkBuildOutput('cd "%s" && %s'%(toString(buildDir), toString(compileCmd)), args.build_timeout))
+    except subprocess.CalledProcessError as e:
+        return e.returncode, toUnicode(compileCmd+'\n') + toUnicode(e.output), 'compiler-version'
+    else:
+        return 0, buildLog, 'compiler-version'
+
 ####
 # build_cmake functions
-def build_cmake(srcRootDir, projName):
+def build_cmake(srcRootDir, projName, projSrcFileNames, args):
     #############
     # delete CMake intermediate output files if submitted
     file_CMakeCache = opjoin(srcRootDir, 'CMakeCache.txt')
@@ -104,35 +183,116 @@ def build_cmake(srcRootDir, projName):
         os.makedirs(buildDir)
     except Exception as e:
         return -1, toUnicode(str(e)), 'cmake-version'
-    return __build_cmake(buildDir, '../')
+    pchCMakeArgs = getPchCMakeArgs(args.precompiled_headers, getCSourceFiles(srcRootDir, projSrcFileNames), '')
+    return __build_cmake(buildDir, '../', args, pchCMakeArgs)
 
-def __build_cmake(buildDir, cmakeLocationFromBuildDir):
+def __build_cmake(buildDir, cmakeLocationFromBuildDir, args, extraCMakeArgs=''):
+    cmakeArgs = seedCMakeBuildDir(buildDir, args.cmake_seed_dir) + extraCMakeArgs
     try:
         if os.name=='posix':
-            buildLog = toUnicode(subprocess.check_output('cd "%s" && %s'%(toString(buildDir), toString(gOSEnv[os.name]['cmake-cmd'](cmakeLocationFromBuildDir))), stderr=subprocess.STDOUT, shell=True))
+            buildLog = toUnicode(checkBuildOutput('cd "%s" && %s'%(toString(buildDir), toString(getCMakeCmd(cmakeLocationFromBuildDir, cmakeArgs, args))), args.build_timeout))
         else:
-            buildLog = toUnicode(subprocess.check_output('pushd "%s" && %s && popd'%(toString(buildDir), toString(gOSEnv[os.name]['cmake-cmd'](cmakeLocationFromBuildDir))), stderr=subprocess.STDOUT, shell=True))
+            buildLog = toUnicode(checkBuildOutput('pushd "%s" && %s && popd'%(toString(buildDir), toString(getCMakeCmd(cmakeLocationFromBuildDir, cmakeArgs, args))), args.build_timeout))
     except subprocess.CalledProcessError as e:
         return e.returncode, toUnicode(e.output), 'cmake-version'
     else:
         return 0, buildLog, 'cmake-version'
 
+def resolveCMakeGenerator(cmakeGenerator):
+    # 'auto' becomes 'ninja' if ninja is available, 'make' otherwise.
+    # Windows always uses NMake.
+    if os.name!='posix':
+        return 'make'
+    if cmakeGenerator=='auto':
+        if find_executable('ninja')!=None:
+            return 'ninja'
+        else:
+            return 'make'
+    return cmakeGenerator
+
+def getNinjaJobArgs(args, numJobs):
+    # ninja runs as many jobs as the number of cores by default, unlike make.
+    # with a jobserver, ninja (>= 1.13) takes job tokens from MAKEFLAGS only if -j is not given.
+    if args.jobserver_fds!=None:
+        return ''
+    return '-j%d'%numJobs
+
+def getCMakeCmd(cmakeLocationFromBuildDir, cmakeArgs, args):
+    if args.cmake_generator=='ninja':
+        return gOSEnv[os.name]['cmake-ninja-cmd'](cmakeLocationFromBuildDir, cmakeArgs, getNinjaJobArgs(args, 1))
+    else:
+        return gOSEnv[os.name]['cmake-cmd'](cmakeLocationFromBuildDir, cmakeArgs)
+
+####
+# shared CMake compiler identification functions
+# CMake identifies the compilers and tests their ABI and features at the first configure of every
+# build dir, and stores the results in <build dir>/CMakeFiles/<cmake version>/.
+# PACERs does it only once for a probe project and copies the results to each build dir before
+# configuring it, so that CMake loads them instead of detecting the toolchain again.
+def prepareCMakeCompilerIdSeed(probeDir, args):
+    # return the CMakeFiles/<cmake version> dir of the configured probe project, or None if it fails.
+    probeBuildDir = opjoin(probeDir, 'build')
+    try:
+        if os.path.exists(probeDir):
+            shutil.rmtree(probeDir)
+        os.makedirs(probeBuildDir)
+        with open(toString(opjoin(probeDir, 'CMakeLists.txt')), 'w') as f:
+            f.write('cmake_minimum_required(VERSION 2.8.12)\n')
+            f.write('project(pacers_cmake_probe C CXX)\n')
+    except (IOError, OSError):
+        return None
+
+    try:
+        if os.name=='posix':
+            checkBuildOutput('cd "%s" && %s'%(toString(probeBuildDir), toString(getCMakeCmd('../', '', args))), args.build_timeout)
+        else:
+            checkBuildOutput('pushd "%s" && %s && popd'%(toString(probeBuildDir), toString(getCMakeCmd('../', '', args))), args.build_timeout)
+    except subprocess.CalledProcessError as e:
+        return None
+
+    cmakeFilesDir = opjoin(probeBuildDir, 'CMakeFiles')
+    for name in os.listdir(cmakeFilesDir):
+        versionDir = opjoin(cmakeFilesDir, name)
+        if os.path.isdir(versionDir) and name[0].isdigit() and os.path.isfile(opjoin(versionDir, 'CMakeSystem.cmake')):
+            return versionDir
+    return None
+
+def seedCMakeBuildDir(buildDir, seedVersionDir):
+    # copy the compiler identification results into buildDir.
+    # return additional cmake arguments for the first configure of buildDir.
+    if seedVersionDir==None:
+        return ''
+    destVersionDir = opjoin(opjoin(buildDir, 'CMakeFiles'), os.path.basename(seedVersionDir))
+    try:
+        if not os.path.isdir(destVersionDir):
+            os.makedirs(destVersionDir)
+        for name in os.listdir(seedVersionDir):
+            if os.path.isfile(opjoin(seedVersionDir, name)):
+                shutil.copy2(opjoin(seedVersionDir, name), opjoin(destVersionDir, name))
+    except (IOError, OSError):
+        return ''
+    # tells CMake that the platform information (CMakeSystem.cmake, ...) is already in the build dir
+    return '-DCMAKE_PLATFORM_INFO_INITIALIZED:INTERNAL=1'
+
 ####
 # build_make functions
-def build_make(srcRootDir, projName):
+def build_make(srcRootDir, projName, args):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
     try:
         # copy all copied files in output source dir(output/assigndir) to output build dir(output/assigndir/pacers-assigndir)
         # because there is no way to set the output destination for a Makefile, unlike CMake.
-        shutil.copytree(srcRootDir, buildDir)
+        if args.make_build_tree=='link':
+            linktree(srcRootDir, buildDir)
+        else:
+            shutil.copytree(srcRootDir, buildDir)
     except Exception as e:
         return -1, toUnicode(str(e)), 'make-version'
-    return __build_make(buildDir, '../')
+    return __build_make(buildDir, '../', args)
 
-def __build_make(buildDir, makeLocationFromBuildDir):
+def __build_make(buildDir, makeLocationFromBuildDir, args):
     try:
         if os.name=='posix':
-            buildLog = toUnicode(subprocess.check_output('cd "%s" && %s'%(toString(buildDir), 'make'), stderr=subprocess.STDOUT, shell=True))
+            buildLog = toUnicode(checkBuildOutput('cd "%s" && %s'%(toString(buildDir), 'make'), args.build_timeout))
         else:
             return -1, 'MAKE_PROJECT is not supported on Windows', 'make-version'
     except subprocess.CalledProcessError as e:
@@ -140,6 +300,135 @@ def __build_make(buildDir, makeLocationFromBuildDir):
     else:
         return 0, buildLog, 'make-version'
 
+####
+# build_superproject functions
+def buildSingleSourceSuperproject(projInfos, superprojectDir, args):
+    # build all C/C++ single source projects in projInfos as targets of one CMake project,
+    # which is configured once and built by a parallel make.
+    # return a list of (buildRetCode, buildLog, buildVersion) for each projInfo,
+    # or None for projects that are not built by the superproject (not C/C++, cache hit results are returned as well).
+    buildResults = [None]*len(projInfos)
+    if os.name!='posix':
+        return buildResults
+
+    targetIndices = []
+    buildHashes = {}
+    for i in range(len(projInfos)):
+        projInfo = projInfos[i]
+        if projInfo['submissionType']!=SINGLE_SOURCE_FILE and projInfo['submissionType']!=SOURCE_FILES:
+            continue
+        extension = os.path.splitext(projInfo['filesInProj'][0])[1].lower()
+        if extension not in gSourceExt or gSourceExt[extension]['build-single-source-func']!='build_single_c_cpp':
+            continue
+        if args.build_cache_dir:
+            buildHashes[i] = getBuildHash(projInfo, args)
+            if buildHashes[i]!=None:
+                buildResults[i] = loadCachedBuild(projInfo, args.build_cache_dir, buildHashes[i])
+                if buildResults[i]!=None:
+                    continue
+        targetIndices.append(i)
+
+    if len(targetIndices)==0:
+        return buildResults
+
+    superBuildDir = opjoin(superprojectDir, 'build')
+    logDir = opjoin(superprojectDir, 'logs')
+    try:
+        if os.path.exists(superprojectDir):
+            shutil.rmtree(superprojectDir)
+        os.makedirs(superBuildDir)
+        os.makedirs(logDir)
+    except Exception as e:
+        return buildResults
+
+    # each compile and link command of a target is prefixed with this launcher,
+    # which appends the command and its output to the log file of the target.
+    # with --build-timeout, each command is killed by timeout(1) with its process group
+    # and the timeout message is appended to the log.
+    launcherPath = opjoin(superprojectDir, 'launcher.sh')
+    timeoutPrefix = ''
+    if args.build_timeout > 0 and find_executable('timeout')!=None:
+        timeoutPrefix = 'timeout -k 1 %g '%args.build_timeout
+    with open(toString(launcherPath), 'w') as f:
+        f.write('#!/bin/sh\n')
+        f.write('log="$1"\n')
+        f.write('shift\n')
+        f.write('echo "$@" >> "$log"\n')
+        f.write('%s"$@" >> "$log" 2>&1\n'%timeoutPrefix)
+        f.write('ret=$?\n')
+        if timeoutPrefix!='':
+            f.write('if [ $ret -eq 124 ] || [ $ret -eq 137 ]; then echo "%s" >> "$log"; fi\n'%(gBuildTimeoutMsg%args.build_timeout))
+        f.write('exit $ret\n')
+
+    logPaths = {}
+    code = u''
+    code += 'cmake_minimum_required(VERSION 2.8.12)\n'
+    code += 'project(pacers_superproject)\n'
+    for i in targetIndices:
+        projInfo = projInfos[i]
+        targetName = 'pacers_target_%d'%i
+        srcPath = os.path.abspath(opjoin(projInfo['submissionDir'], projInfo['filesInProj'][0]))
+        buildDir = os.path.abspath(opjoin(projInfo['submissionDir'], gBuildDirPrefix+projInfo['projName']))
+        logPaths[i] = opjoin(logDir, '%d.log'%i)
+        launcher = '/bin/sh "%s" "%s"'%(launcherPath, logPaths[i])
+        code += 'add_executable(%s "%s")\n'%(targetName, escapeCMakeString(srcPath))
+        code += 'set_target_properties(%s PROPERTIES OUTPUT_NAME "%s" RUNTIME_OUTPUT_DIRECTORY "%s" RULE_LAUNCH_COMPILE "%s" RULE_LAUNCH_LINK "%s")\n'\
+                %(targetName, escapeCMakeString(projInfo['projName']), escapeCMakeString(buildDir), escapeCMakeString(launcher), escapeCMakeString(launcher))
+        pchHeaderPath = getPchHeaderPath(args.precompiled_headers, getSourceLanguage(srcPath), [srcPath], '')
+        if pchHeaderPath!=None:
+            code += 'set_target_properties(%s PROPERTIES COMPILE_FLAGS "%s")\n'%(targetName, escapeCMakeString(getPchCompilerFlag(pchHeaderPath)))
+    with open(toString(opjoin(superprojectDir, 'CMakeLists.txt')), 'w') as f:
+        f.write(toString(code))
+
+    # configure once
+    cmakeArgs = seedCMakeBuildDir(superBuildDir, args.cmake_seed_dir)
+    if args.cmake_generator=='ninja':
+        cmakeArgs += ' -G Ninja'
+    try:
+        configureLog = toUnicode(checkBuildOutput('cd "%s" && cmake .. %s'%(toString(superBuildDir), cmakeArgs), args.build_timeout))
+    except subprocess.CalledProcessError as e:
+        # fall back to building each project separately
+        return buildResults
+
+    # build all targets, keep going on build errors of some targets
+    if args.cmake_generator=='ninja':
+        makeCmd = 'ninja -k 0 %s'%getNinjaJobArgs(args, args.num_cores)
+    elif args.jobserver_fds!=None:
+        makeCmd = 'make -k'     # -j is given by the jobserver in MAKEFLAGS
+    else:
+        makeCmd = 'make -k -j%d'%args.num_cores
+    buildRetCode = 0
+    jobServerState = beginJobServerBuild(args.jobserver_fds)
+    try:
+        # in case timeout(1) is not available, a hung target stops the whole superproject build
+        checkBuildOutput('cd "%s" && %s'%(toString(superBuildDir), makeCmd), args.build_timeout*len(targetIndices))
+    except subprocess.CalledProcessError as e:
+        buildRetCode = e.returncode
+    finally:
+        endJobServerBuild(args.jobserver_fds, jobServerState)
+
+    for i in targetIndices:
+        projInfo = projInfos[i]
+        execPath = opjoin(opjoin(projInfo['submissionDir'], gBuildDirPrefix+projInfo['projName']), projInfo['projName'])
+        try:
+            with open(toString(logPaths[i]), 'r') as f:
+                buildLog = toUnicode(f.read())
+        except IOError:
+            buildLog = u'The target of this project was not built in the superproject.'
+        if os.path.isfile(execPath):
+            buildResults[i] = (0, buildLog, 'cmake-version')
+        elif args.build_timeout > 0 and gBuildTimeoutMsg%args.build_timeout in buildLog:
+            buildResults[i] = (gBuildTimeoutRetCode, buildLog, 'cmake-version')
+        else:
+            buildResults[i] = (buildRetCode if buildRetCode!=0 else 1, buildLog, 'cmake-version')
+        if i in buildHashes and buildHashes[i]!=None:
+            storeCachedBuild(projInfo, args.build_cache_dir, buildHashes[i], buildResults[i][0], buildResults[i][1], buildResults[i][2])
+
+    return buildResults
+
+def escapeCMakeString(s):
+    return s.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$')
+
 # return CMakeLists.txt code
 def makeCMakeLists_single_c_cpp(projName, singleSrcFileName, buildDir):
     code = u''
@@ -154,7 +443,7 @@ def makeCMakeLists_single_c_cpp(projName, singleSrcFileName, buildDir):
 
 ####
 # build_vcxproj functions
-def build_vcxproj(srcRootDir, projName):
+def build_vcxproj(srcRootDir, projName, args):
     # do not need to make buildDir. msbuild.exe automatically makes the outdir.
     # buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
     # os.makedirs(buildDir)
@@ -172,9 +461,9 @@ def build_vcxproj(srcRootDir, projName):
     try:
         # print 'vcvars32.bat && msbuild.exe "%s" /property:OutDir="%s/";IntDir="%s/"'\
                 # %(vcxprojNames[0], gBuildDirPrefix+projName, gBuildDirPrefix+projName)
-        buildLog = toUnicode(subprocess.check_output('vcvars32.bat && msbuild.exe "%s" /property:OutDir="%s/";IntDir="%s/"'
+        buildLog = toUnicode(checkBuildOutput('vcvars32.bat && msbuild.exe "%s" /property:OutDir="%s/";IntDir="%s/"'
                 %(toString(vcxprojNames[0]), toString(gBuildDirPrefix+projName), toString(gBuildDirPrefix+projName)),
-                stderr=subprocess.STDOUT, shell=True))
+                args.build_timeout))
     except subprocess.CalledProcessError as e:
         return e.returncode, toUnicode(e.output), 'visual-cpp-version'
     else:
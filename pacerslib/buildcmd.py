@@ -0,0 +1,100 @@
+################################################################################
+# buildcmd.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, subprocess, threading, time, select, errno
+from global_const import *
+from supervisor import *
+
+############################################
+# build command functions
+# Every build step (compilers, cmake, make, ...) is run by checkBuildOutput(), so that --build-timeout
+# applies to all of them.
+def checkBuildOutput(cmd, buildTimeout):
+    # same as subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True),
+    # but kills cmd and all its subprocesses (make, cmake, compilers, ...) if it does not finish
+    # in buildTimeout seconds, and then raises CalledProcessError whose returncode is gBuildTimeoutRetCode.
+    # buildTimeout 0 means no limit.
+    # with --build-jobserver, job tokens held by the killed subprocesses are not returned,
+    # which only reduces the number of parallel jobs of the following builds.
+    if buildTimeout <= 0:
+        return subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+
+    with open(os.devnull, 'r') as devnull:
+        if os.name=='posix':
+            # run cmd in a new session, so that the whole process group can be killed
+            proc = subprocess.Popen(cmd, stdin=devnull, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True, preexec_fn=os.setsid)
+            output, timedOut = readBuildOutput(proc, buildTimeout)
+        else:
+            proc = subprocess.Popen(cmd, stdin=devnull, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True)
+            timer = threading.Timer(buildTimeout, onBuildTimeOut, [proc])
+            timer.start()
+            output = proc.communicate()[0]
+            timedOut = not timer.is_alive()
+            timer.cancel()
+
+    if timedOut:
+        raise subprocess.CalledProcessError(gBuildTimeoutRetCode, cmd, output+'\n'+gBuildTimeoutMsg%buildTimeout)
+    if proc.returncode!=0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output)
+    return output
+
+def readBuildOutput(proc, buildTimeout):
+    # read the output of proc until it finishes or buildTimeout is reached.
+    # proc is finished when its shell has exited, even if a process it started in the background
+    # (e.g. a compiler cache server) still holds the pipe.
+    # return output, timedOut
+    fd = proc.stdout.fileno()
+    chunks = []
+    deadline = time.time() + buildTimeout
+    timedOut = False
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            timedOut = True
+            killProcessGroup(proc.pid)
+            break
+        try:
+            readable = select.select([fd], [], [], min(remaining, gBuildPollInterval))[0]
+        except select.error as e:
+            if e.args[0]==errno.EINTR:
+                continue
+            raise
+        if readable:
+            data = os.read(fd, 1<<16)
+            if not data:
+                break
+            chunks.append(data)
+        if proc.poll()!=None:
+            break
+
+    # read what the exited or killed processes have written, but do not wait for processes
+    # that are still running in the background or left the process group and hold the pipe
+    drainDeadline = time.time() + gBuildDrainTime
+    while time.time() < drainDeadline and select.select([fd], [], [], gBuildPollInterval)[0]:
+        data = os.read(fd, 1<<16)
+        if not data:
+            break
+        chunks.append(data)
+
+    proc.stdout.close()
+    proc.wait()
+    return ''.join(chunks), timedOut
+
+def onBuildTimeOut(proc):
+    # windows specific - to kill both cmd.exe and its subprocesses
+    subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=proc.pid))
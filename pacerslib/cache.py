@@ -0,0 +1,236 @@
+################################################################################
+# cache.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, shutil, hashlib, json, fnmatch
+from global_const import *
+from unicode import *
+from version import *
+
+############################################
+# build cache functions
+# A cache entry is a directory named after the hash of everything that can change a build result:
+#   <cacheDir>/<hash[:2]>/<hash>/
+#       - build-result.json : buildRetCode, buildLog, buildVersion, outputNames
+#       - output files (executables) copied from the top level of the build dir
+
+def getToolchainHash(args):
+    # fingerprint of the tools used to build projects.
+    # version strings of cmake, make and compilers and build-related environment variables are included.
+    h = hashlib.sha1()
+    h.update(os.name)
+    if os.name=='posix':
+        buildVersions = ['cmake-version', 'make-version']
+    else:
+        buildVersions = ['cmake-version', 'visual-cpp-version']
+    for buildVersion in buildVersions:
+        for versionText in eval(gOSEnv[os.name][buildVersion])(args.interpreter_cmd, args.pre_shell_cmd):
+            h.update(toString(toUnicode(versionText)))
+    if args.cmake_generator=='ninja':
+        h.update(toString(getNinjaVersion()))
+    if args.single_source_builder=='compiler':
+        for versionText in eval(gOSEnv[os.name]['compiler-version'])(args.c_compiler_cmd, args.cpp_compiler_cmd):
+            h.update(toString(toUnicode(versionText)))
+    for envName in ['CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'LDFLAGS', 'MAKEFLAGS']:
+        h.update('%s=%s\n'%(envName, os.environ.get(envName, '')))
+    return h.hexdigest()
+
+def getBuildInputFiles(projInfo):
+    # return [(relative path, absolute path), ...] of all files that can affect the build of a project
+    submissionType = projInfo['submissionType']
+    submissionDir = projInfo['submissionDir']
+
+    if submissionType==SINGLE_SOURCE_FILE:
+        # submissionDir is the assignment dir (shared by all submissions) for this type.
+        return [(fileName, opjoin(submissionDir, fileName)) for fileName in projInfo['filesInProj']]
+
+    inputFiles = []
+    if os.name=='posix':
+        # Convert paths for os.walk to byte string only for posix os (due to python bug?)
+        tempSubDir = toString(submissionDir)
+    else:
+        tempSubDir = submissionDir
+    for root, dirs, files in os.walk(tempSubDir):
+        dirs[:] = [d for d in dirs if gBuildDirPrefix not in d]
+        for name in files:
+            if os.name=='posix':
+                root = toUnicode(root)
+                name = toUnicode(name)
+            filePath = opjoin(root, name)
+            fileName = filePath.replace(submissionDir+os.sep, '')
+            # CMake intermediate outputs are deleted by build_cmake() before building, so they cannot affect the build.
+            isInput = True
+            for pattern in gExcludePatterns[submissionType]:
+                if fnmatch.fnmatch(fileName, pattern):
+                    isInput = False
+                    break
+            if isInput:
+                inputFiles.append((fileName, filePath))
+    inputFiles.sort()
+    return inputFiles
+
+def getBuildRecipe(projInfo, args):
+    # everything other than input file contents that determines how a project is built
+    recipe = []
+    recipe.append('submissionType=%s'%gSubmissionTypeName[projInfo['submissionType']])
+    recipe.append('projName=%s'%toString(projInfo['projName']))
+    recipe.append('mainFile=%s'%toString(projInfo['filesInProj'][0] if len(projInfo['filesInProj'])>0 else ''))
+    recipe.append('toolchain=%s'%args.toolchain_hash)
+    recipe.append('cmakeGenerator=%s'%args.cmake_generator)
+    # the precompiled header forced into a build can change its log, not its executable
+    if args.precompiled_headers!=None:
+        recipe.append('precompiledHeaders=%s'%','.join(sorted([toString(args.precompiled_headers[language][0]) for language in args.precompiled_headers])))
+    if projInfo['submissionType']==SINGLE_SOURCE_FILE or projInfo['submissionType']==SOURCE_FILES:
+        recipe.append('singleSourceBuilder=%s'%args.single_source_builder)
+        if args.single_source_builder=='compiler':
+            recipe.append('compilers=%s %s'%(toString(args.c_compiler_cmd), toString(args.cpp_compiler_cmd)))
+            recipe.append('compilerFlags=%s'%toString(args.compiler_flags))
+    return '\n'.join(recipe)
+
+def updateHashWithFiles(h, inputFiles):
+    for fileName, filePath in inputFiles:
+        h.update('\0%s\0'%toString(fileName))
+        with open(toString(filePath), 'rb') as f:
+            while True:
+                data = f.read(1<<16)
+                if not data:
+                    break
+                h.update(data)
+
+def getBuildHash(projInfo, args):
+    # return None if any input file cannot be read
+    h = hashlib.sha1()
+    h.update(getBuildRecipe(projInfo, args))
+    try:
+        updateHashWithFiles(h, getBuildInputFiles(projInfo))
+    except (IOError, OSError):
+        return None
+    return h.hexdigest()
+
+def getProjContentHash(projInfo):
+    # hash of the contents of a project regardless of its submission title and project name.
+    # return None if any input file cannot be read
+    submissionType = projInfo['submissionType']
+    inputFiles = getBuildInputFiles(projInfo)
+
+    h = hashlib.sha1()
+    h.update('submissionType=%s\n'%gSubmissionTypeName[submissionType])
+    if submissionType==SINGLE_SOURCE_FILE:
+        # only the extension of the file name matters (student01.c and student02.c are the same project if identical)
+        h.update('ext=%s\n'%toString(os.path.splitext(projInfo['filesInProj'][0])[1].lower()))
+        inputFiles = [('', filePath) for fileName, filePath in inputFiles]
+    else:
+        h.update('mainFile=%s\n'%toString(projInfo['filesInProj'][0] if len(projInfo['filesInProj'])>0 else ''))
+    try:
+        updateHashWithFiles(h, inputFiles)
+    except (IOError, OSError):
+        return None
+    return h.hexdigest()
+
+def getBuildCacheEntryDir(cacheDir, buildHash):
+    return opjoin(opjoin(cacheDir, buildHash[:2]), buildHash)
+
+def getBuildOutputNames(buildDir):
+    # files in the top level of buildDir that are worth restoring (executables)
+    outputNames = []
+    if not os.path.isdir(buildDir):
+        return outputNames
+    for name in os.listdir(buildDir):
+        filePath = opjoin(buildDir, name)
+        if not os.path.isfile(filePath):
+            continue
+        if os.name=='posix':
+            if os.access(filePath, os.X_OK):
+                outputNames.append(name)
+        else:
+            if os.path.splitext(name)[1].lower()=='.exe':
+                outputNames.append(name)
+    return outputNames
+
+def isBuildResultCacheable(buildRetCode, buildVersion):
+    # only a successful build (0) or a build error of the submitted code (a positive exit code) is cached.
+    # -1 (internal error) is not a build result of the submitted code.
+    # a timed out build (gBuildTimeoutRetCode) may succeed on a less loaded machine.
+    # a build killed by a signal (a negative return code, or 128+signal from the shell that ran it)
+    # may succeed when it is not killed, e.g. by the OOM killer.
+    # no-build-version and python-version are not real builds.
+    return 0 <= buildRetCode <= gMaxBuildErrorRetCode and buildVersion not in ['no-build-version', 'python-version']
+
+def loadCachedBuild(projInfo, cacheDir, buildHash):
+    # return (buildRetCode, buildLog, buildVersion) restored from the cache, or None if it is a cache miss.
+    entryDir = getBuildCacheEntryDir(cacheDir, buildHash)
+
+    try:
+        with open(opjoin(entryDir, 'build-result.json'), 'r') as f:
+            result = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    buildDir = opjoin(projInfo['submissionDir'], gBuildDirPrefix+projInfo['projName'])
+    try:
+        if not os.path.isdir(buildDir):
+            os.makedirs(buildDir)
+        for name in result['outputNames']:
+            shutil.copy2(opjoin(entryDir, name), opjoin(buildDir, name))
+    except (IOError, OSError):
+        return None
+
+    return result['buildRetCode'], result['buildLog'], result['buildVersion']
+
+def storeCachedBuild(projInfo, cacheDir, buildHash, buildRetCode, buildLog, buildVersion):
+    if not isBuildResultCacheable(buildRetCode, buildVersion):
+        return
+
+    entryDir = getBuildCacheEntryDir(cacheDir, buildHash)
+    if os.path.isdir(entryDir):
+        return
+
+    buildDir = opjoin(projInfo['submissionDir'], gBuildDirPrefix+projInfo['projName'])
+    outputNames = getBuildOutputNames(buildDir) if buildRetCode==0 else []
+
+    # fill a temporary dir first and rename it, so that other processes never see a half-written entry
+    tempEntryDir = '%s-tmp-%d'%(entryDir, os.getpid())
+    try:
+        os.makedirs(tempEntryDir)
+        for name in outputNames:
+            shutil.copy2(opjoin(buildDir, name), opjoin(tempEntryDir, name))
+        result = {'buildRetCode':buildRetCode, 'buildLog':buildLog, 'buildVersion':buildVersion, 'outputNames':outputNames}
+        with open(opjoin(tempEntryDir, 'build-result.json'), 'w') as f:
+            json.dump(result, f)
+        os.rename(tempEntryDir, entryDir)
+    except (IOError, OSError):
+        shutil.rmtree(tempEntryDir, ignore_errors=True)
+
+############################################
+# in-run deduplication functions
+def getDedupRepresentatives(allProjInfos):
+    # return a list whose i-th element is the index of the first project identical to allProjInfos[i].
+    # a project is identical to another if both have the same contents, stdInputs and cmdArgss.
+    # projects with unreadable files are never deduplicated.
+    representatives = range(len(allProjInfos))
+    firstIndexOfKey = {}
+    for i in range(len(allProjInfos)):
+        projInfo = allProjInfos[i]
+        contentHash = getProjContentHash(projInfo)
+        if contentHash==None:
+            continue
+        key = (contentHash, tuple(projInfo['stdInputs']), tuple(projInfo['cmdArgss']))
+        if key in firstIndexOfKey:
+            representatives[i] = firstIndexOfKey[key]
+        else:
+            firstIndexOfKey[key] = i
+    return representatives
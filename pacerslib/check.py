@@ -0,0 +1,123 @@
+################################################################################
+# check.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os
+from unicode import *
+
+############################################
+# expected output functions
+# The stdout of a run passes if it is the same as its expected output, ignoring carriage returns
+# and whitespace at the end. OutputChecker compares stdout while the program is printing it,
+# so a program can be killed soon after its output has become wrong instead of at its exit or timeout.
+#
+# outputCheck (runStat['outputCheck']):
+#   {'diffOffset':int or None} or None if the run has no expected output.
+#   diffOffset - offset of the first byte of stdout (without carriage returns) that differs
+#                from the expected output, None if stdout is the same as the expected output.
+#
+# Projects and run tasks only carry the paths of the expected output files (expectedOutputPaths),
+# and each process reads a file once when one of its runs needs it.
+
+# a program is killed when it has printed this many bytes after the first difference
+# (to show what went wrong in the report) or after the end of its expected output.
+gExpectedOutputMargin = 1024
+
+# path -> contents of expected output files read by this process
+gExpectedOutputCache = {}
+
+def loadExpectedOutputPaths(paths):
+    # return a list of absolute paths of readable expected output files, errorMsg.
+    # a single directory in paths means all files in it, in the order of their names.
+    if len(paths)==1 and os.path.isdir(paths[0]):
+        dirPath = paths[0]
+        paths = [opjoin(dirPath, name) for name in sorted(os.listdir(dirPath)) if os.path.isfile(opjoin(dirPath, name))]
+        if len(paths)==0:
+            return None, 'No expected output file in \'%s\'.'%dirPath
+
+    for path in paths:
+        if not os.access(toString(path), os.R_OK) or not os.path.isfile(toString(path)):
+            return None, 'Unable to read the expected output \'%s\'.'%path
+    return [os.path.abspath(path) for path in paths], None
+
+def getExpectedOutput(expectedOutputPaths, caseIndex):
+    # the expected output of the caseIndex-th run of a project, or None.
+    # the last one is used for the remaining runs, as STD_INPUT and CMD_ARGS do.
+    if expectedOutputPaths==None or len(expectedOutputPaths)==0:
+        return None
+    path = expectedOutputPaths[min(caseIndex, len(expectedOutputPaths)-1)]
+    if path not in gExpectedOutputCache:
+        try:
+            with open(toString(path), 'rb') as f:
+                gExpectedOutputCache[path] = f.read()
+        except (IOError, OSError):
+            # the run is not checked and its verdict is an error
+            gExpectedOutputCache[path] = None
+    return gExpectedOutputCache[path]
+
+class OutputChecker(object):
+    def __init__(self, expectedOutput):
+        self.expected = expectedOutput.replace('\r', '').rstrip()
+        self.numChecked = 0     # number of bytes of stdout (without carriage returns) seen so far
+        self.diffOffset = None
+
+    def add(self, data):
+        data = data.replace('\r', '')
+        if self.diffOffset==None:
+            numExpected = max(min(len(data), len(self.expected)-self.numChecked), 0)
+            if data[:numExpected]!=self.expected[self.numChecked:self.numChecked+numExpected]:
+                self.diffOffset = self.numChecked + getFirstDiffIndex(data, self.expected[self.numChecked:])
+            else:
+                # only whitespace may follow the expected output
+                rest = data[numExpected:]
+                if rest.strip()!='':
+                    self.diffOffset = self.numChecked + numExpected + (len(rest)-len(rest.lstrip()))
+        self.numChecked += len(data)
+
+    def shouldStop(self):
+        # True if the result cannot change any more
+        if self.diffOffset!=None:
+            return self.numChecked > self.diffOffset + gExpectedOutputMargin
+        if self.numChecked > len(self.expected) + gExpectedOutputMargin:
+            # too much trailing whitespace
+            self.diffOffset = len(self.expected)
+            return True
+        return False
+
+    def getOutputCheck(self):
+        # called after the program has finished
+        if self.diffOffset==None and self.numChecked < len(self.expected):
+            # stdout is shorter than the expected output
+            self.diffOffset = self.numChecked
+        return {'diffOffset':self.diffOffset}
+
+def getFirstDiffIndex(s1, s2):
+    for i in range(min(len(s1), len(s2))):
+        if s1[i]!=s2[i]:
+            return i
+    return min(len(s1), len(s2))
+
+def getOutputChecker(expectedOutput):
+    if expectedOutput==None:
+        return None
+    return OutputChecker(expectedOutput)
+
+def checkOutput(expectedOutput, outputStr):
+    # return outputCheck of the whole outputStr
+    checker = OutputChecker(expectedOutput)
+    checker.add(outputStr)
+    return checker.getOutputCheck()
@@ -18,6 +18,14 @@
 ################################################################################
 import os, zipfile, shutil, subprocess
 from unicode import *
+if os.name=='posix':
+    import fcntl
+
+FICLONE = 0x40049409    # linux/fs.h
+
+# files that are likely to be (re)written in place by make.
+# they are never hardlinked by linktree() so that writing them does not change the source tree.
+gBuildOutputExts = ['.o', '.obj', '.a', '.lib', '.so', '.dll', '.exe', '.out', '.d', '.gch', '.pch']
 
 def copytree2(src, dst, symlinks=False, ignore=None):
     for item in os.listdir(src):
@@ -28,6 +36,84 @@ def copytree2(src, dst, symlinks=False, ignore=None):
         else:
             shutil.copy2(s, d)
 
+def linktree(src, dst):
+    # make dst a tree that has the same files as src, without copying file contents if possible.
+    # each file is reflinked (copy-on-write clone, if the file system supports it), hardlinked,
+    # or copied in that order of preference. files that are likely to be written by a build
+    # (see gBuildOutputExts and executables) are reflinked or copied, but never hardlinked.
+    names = os.listdir(src)
+    os.makedirs(dst)
+    for name in names:
+        s = opjoin(src, name)
+        d = opjoin(dst, name)
+        if os.path.isdir(s):
+            linktree(s, d)
+        elif isBuildOutputFile(s):
+            if not reflinkFile(s, d):
+                shutil.copy2(s, d)
+        else:
+            if not reflinkFile(s, d):
+                linkOrCopyFile(s, d)
+
+def isBuildOutputFile(path):
+    if os.path.splitext(path)[1].lower() in gBuildOutputExts:
+        return True
+    return os.name=='posix' and os.access(path, os.X_OK)
+
+def reflinkFile(src, dst):
+    # return True if dst is created as a copy-on-write clone of src
+    if os.name!='posix':
+        return False
+    try:
+        with open(toString(src), 'rb') as fsrc:
+            with open(toString(dst), 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except (IOError, OSError):
+        try:
+            os.remove(toString(dst))
+        except OSError:
+            pass
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def linkOrCopyFile(src, dst):
+    # hardlink src to dst if possible (same file system, posix), otherwise copy it
+    if os.name=='posix':
+        try:
+            os.link(toString(src), toString(dst))
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+# ELF header functions
+# e_type of an ELF file is a 2-byte integer at offset 16, whose byte order is given by e_ident[EI_DATA] at offset 5.
+ELFMAG = '\x7fELF'     # elf.h
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+ET_EXEC = 2
+ET_DYN = 3
+
+def getElfType(path):
+    # return e_type of the ELF file path, or None if it is not an ELF file
+    try:
+        with open(toString(path), 'rb') as f:
+            header = f.read(18)
+    except (IOError, OSError):
+        return None
+    if len(header) < 18 or header[:4]!=ELFMAG:
+        return None
+    if ord(header[5])==ELFDATA2LSB:
+        return ord(header[16]) | ord(header[17])<<8
+    elif ord(header[5])==ELFDATA2MSB:
+        return ord(header[16])<<8 | ord(header[17])
+    return None
+
+def isElfExecutable(path):
+    # same as 'EXEC' or 'DYN' (position independent executables) of Type: in readelf -h
+    return getElfType(path) in [ET_EXEC, ET_DYN]
+
 def unzipInAssignDir(assignDir):
     # if assignDir has zip files, then extract them and make directories
     # The extracted directories would be considered as submissionPaths
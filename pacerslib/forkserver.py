@@ -0,0 +1,189 @@
+################################################################################
+# forkserver.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, subprocess, shlex, json, select, errno, signal
+from unicode import *
+if os.name=='posix':
+    import fcntl
+
+############################################
+# python fork server functions (Linux only)
+# Starting an interpreter takes most of the run time of a short python script.
+# A fork server is an interpreter that runs pyforkserver.py and has already started up.
+# For each run it forks a child which becomes the target program: the child leads a new session,
+# takes the pipes of PACERs as its stdin, stdout and stderr, changes its cwd and argv,
+# and executes the script of the submission with runpy (execfile() for python 2).
+# The pipes are passed by their /proc/<pid>/fd/<fd> paths, which the server opens before forking.
+#
+# Each PACERs process (the main process and each pool worker) has its own fork server
+# for each INTERPRETER_CMD, which exits when the PACERs process exits.
+# ForkServerChild has the attributes of subprocess.Popen that ProcessSupervisor uses,
+# so a run in a fork server is supervised, killed and swept like any other run.
+
+gForkServerScriptPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pyforkserver.py')
+
+gForkServers = {}   # (pid of PACERs process, interpreterCmd) -> ForkServer
+
+class ForkServerError(Exception):
+    pass
+
+class ForkServerRUsage(object):
+    # the fields of the resource.struct_rusage of os.wait4() used by ProcessSupervisor
+    def __init__(self, utime, stime, maxrss):
+        self.ru_utime = utime
+        self.ru_stime = stime
+        self.ru_maxrss = maxrss
+
+class ForkServerChild(object):
+    def __init__(self, server, pid, stdin, stdout, stderr):
+        self.server = server
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self.rusage = None
+
+    def poll(self):
+        if self.returncode==None:
+            self.server.readMessages()
+            if self.pid in self.server.exitedChildren:
+                status, self.rusage = self.server.exitedChildren.pop(self.pid)
+                if os.WIFSIGNALED(status):
+                    self.returncode = -os.WTERMSIG(status)
+                else:
+                    self.returncode = os.WEXITSTATUS(status)
+        return self.returncode
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+class ForkServer(object):
+    def __init__(self, interpreterCmd):
+        with open(os.devnull, 'r+') as devnull:
+            self.proc = subprocess.Popen(shlex.split(toString(interpreterCmd))+[gForkServerScriptPath],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=devnull, close_fds=True)
+        fd = self.proc.stdout.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        # the server exits when PACERs exits, not when the last target program inheriting its stdin exits
+        setCloseOnExec(self.proc.stdin.fileno())
+        setCloseOnExec(fd)
+        self.buf = ''
+        self.responses = []
+        self.exitedChildren = {}    # pid -> (wait status, ForkServerRUsage)
+        self.runningPids = set()
+
+    def isAlive(self):
+        return self.proc.poll()==None
+
+    def start(self, scriptPath, args, cwd, stdinPath=None):
+        # return a ForkServerChild running scriptPath, or raise ForkServerError.
+        # the stdin of the child is the file stdinPath if it is not None.
+        pipes = [os.pipe(), os.pipe(), os.pipe()]
+        for readFd, writeFd in pipes:
+            setCloseOnExec(readFd)
+            setCloseOnExec(writeFd)
+        # ends of the pipes for the child
+        childFds = [pipes[0][0], pipes[1][1], pipes[2][1]]
+        childFdPaths = ['/proc/%d/fd/%d'%(os.getpid(), fd) for fd in childFds]
+        if stdinPath!=None:
+            childFdPaths[0] = toUnicode(stdinPath)
+        request = {'script':toUnicode(scriptPath), 'args':[toUnicode(arg) for arg in args], 'cwd':toUnicode(cwd),
+                   'fds':childFdPaths}
+        try:
+            self.proc.stdin.write(json.dumps(request)+'\n')
+            self.proc.stdin.flush()
+            response = self.waitResponse()
+        except (IOError, OSError, ForkServerError) as e:
+            response = {'type':'error', 'msg':str(e)}
+        finally:
+            # the server has opened its own copies of them
+            for fd in childFds:
+                os.close(fd)
+
+        if response['type']!='started':
+            for fd in [pipes[0][1], pipes[1][0], pipes[2][0]]:
+                os.close(fd)
+            raise ForkServerError(response['msg'])
+
+        pid = response['pid']
+        self.runningPids.add(pid)
+        if stdinPath!=None:
+            os.close(pipes[0][1])
+            stdin = None
+        else:
+            stdin = os.fdopen(pipes[0][1], 'wb')
+        return ForkServerChild(self, pid, stdin, os.fdopen(pipes[1][0], 'rb'), os.fdopen(pipes[2][0], 'rb'))
+
+    def waitResponse(self):
+        # return the response to the last request
+        while len(self.responses)==0:
+            if not self.readMessages():
+                raise ForkServerError('The fork server has exited.')
+            if len(self.responses)==0:
+                select.select([self.proc.stdout.fileno()], [], [])
+        return self.responses.pop(0)
+
+    def readMessages(self):
+        # read all available messages without blocking. return False if the server has exited.
+        while True:
+            try:
+                data = os.read(self.proc.stdout.fileno(), 1<<16)
+            except OSError as e:
+                if e.errno==errno.EAGAIN or e.errno==errno.EINTR:
+                    break
+                raise
+            if not data:
+                # the children of a dead server can never be reaped by PACERs
+                for pid in self.runningPids:
+                    self.exitedChildren[pid] = (signal.SIGKILL, None)
+                self.runningPids.clear()
+                return False
+            self.buf += data
+
+        while '\n' in self.buf:
+            line, self.buf = self.buf.split('\n', 1)
+            message = json.loads(line)
+            if message['type']=='exited':
+                self.runningPids.discard(message['pid'])
+                self.exitedChildren[message['pid']] = (message['status'], ForkServerRUsage(message['utime'], message['stime'], message['maxrss']))
+            else:
+                self.responses.append(message)
+        return True
+
+def getForkServer(interpreterCmd):
+    # return the fork server of this process for interpreterCmd, or raise ForkServerError
+    key = (os.getpid(), interpreterCmd)
+    if key not in gForkServers or not gForkServers[key].isAlive():
+        try:
+            gForkServers[key] = ForkServer(interpreterCmd)
+        except OSError as e:
+            raise ForkServerError(str(e))
+    return gForkServers[key]
+
+def startForkServerRun(interpreterCmd, scriptPath, cmdArg, cwd, stdinPath=None):
+    # same as subprocess.Popen('INTERPRETER_CMD scriptPath cmdArg', cwd=cwd, preexec_fn=os.setsid) with pipes
+    # (stdin is the file stdinPath if it is not None).
+    # raise ForkServerError if the fork server cannot run it.
+    return getForkServer(interpreterCmd).start(scriptPath, shlex.split(toString(cmdArg)), cwd, stdinPath)
+
+def setCloseOnExec(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
@@ -30,6 +30,25 @@ END_SUBMISSION_TYPE   = 6
 
 gLogPrefix = '# '
 gBuildDirPrefix = 'pacers-build-'
+gSuperprojectDirName = 'pacers-superproject'
+gCMakeProbeDirName = 'pacers-cmake-probe'
+gPchDirName = 'pacers-pch'
+gReferenceDirName = 'pacers-reference'
+
+# buildRetCode of a build killed by --build-timeout
+gBuildTimeoutRetCode = -2
+gBuildTimeoutMsg = 'Build timed out after %g seconds.'
+# the largest buildRetCode of a build error. the shell that runs a build returns 128+signal
+# when the build command is killed by a signal.
+gMaxBuildErrorRetCode = 128
+# seconds between checks whether a build with --build-timeout has exited, and
+# seconds to read the remaining output after it has exited or has been killed
+gBuildPollInterval = .1
+gBuildDrainTime = .5
+
+gOutputLimitMsg = 'Killed after printing more than %d KiB.'
+gOutputDivergedMsg = 'Killed after its output diverged from the expected output.'
+gWorkerDiedMsg = 'The worker process of PACERs died with exit code %s.'
 
 gSubmissionTypeDescrption                        = {}
 gSubmissionTypeDescrption[CMAKE_PROJECT]         = 'CMAKE_PROJECT - the submission has CMakeLists.txt.'
@@ -62,6 +81,7 @@ gExcludePatterns[SINGLE_SOURCE_FILE]       = []
 gVersionDescription                        = {}
 gVersionDescription['cmake-version']       = 'CMake & C/C++ compiler'
 gVersionDescription['make-version']        = 'Make & C/C++ compiler'
+gVersionDescription['compiler-version']    = 'C/C++ compiler'
 gVersionDescription['visual-cpp-version']  = 'Visual C/C++ compiler'
 gVersionDescription['python-version']      = 'Python'
 
@@ -87,16 +107,21 @@ gSourceExt['.py']['default-interpreter-cmd'] = 'python'
 # gOSEnv
 gOSEnv = {'nt':{}, 'posix':{}}
 
-gOSEnv['nt']['cmake-cmd'] = lambda cmakeLocationFromBuildDir: 'vcvars32.bat && cmake %s -G "NMake Makefiles" && nmake'%cmakeLocationFromBuildDir
-gOSEnv['posix']['cmake-cmd'] = lambda cmakeLocationFromBuildDir: 'cmake %s && make'%cmakeLocationFromBuildDir
+gOSEnv['nt']['cmake-cmd'] = lambda cmakeLocationFromBuildDir, cmakeArgs='': 'vcvars32.bat && cmake %s -G "NMake Makefiles" %s && nmake'%(cmakeLocationFromBuildDir, cmakeArgs)
+gOSEnv['posix']['cmake-cmd'] = lambda cmakeLocationFromBuildDir, cmakeArgs='': 'cmake %s %s && make'%(cmakeLocationFromBuildDir, cmakeArgs)
+gOSEnv['posix']['cmake-ninja-cmd'] = lambda cmakeLocationFromBuildDir, cmakeArgs='', ninjaArgs='': 'cmake %s -G Ninja %s && ninja %s'%(cmakeLocationFromBuildDir, cmakeArgs, ninjaArgs)
+
+gOSEnv['posix']['compiler-cmd'] = lambda compilerCmd, srcFileFromBuildDir, execName, compilerFlags: '%s "%s" -o "%s" %s'%(compilerCmd, srcFileFromBuildDir, execName, compilerFlags)
 
 # # for debugging
-# gOSEnv['posix']['cmake-cmd'] = lambda cmakeLocationFromBuildDir: 'cmake %s && make VERBOSE=1'%cmakeLocationFromBuildDir
+# gOSEnv['posix']['cmake-cmd'] = lambda cmakeLocationFromBuildDir, cmakeArgs='': 'cmake %s %s && make VERBOSE=1'%(cmakeLocationFromBuildDir, cmakeArgs)
 
 gOSEnv['nt']['cmake-version'] = 'getCMakeVersionWindows'
 gOSEnv['posix']['cmake-version'] = 'getCMakeVersionPosix'
 gOSEnv['nt']['make-version'] = 'getMakeVersionWindows'
 gOSEnv['posix']['make-version'] = 'getMakeVersionPosix'
+gOSEnv['nt']['compiler-version'] = '''lambda temp1, temp2: ['Building with --single-source-builder compiler is not supported in this platform.']'''
+gOSEnv['posix']['compiler-version'] = 'getCompilerVersionPosix'
 gOSEnv['nt']['visual-cpp-version'] = 'getVisulCppVersionWindows'
 gOSEnv['posix']['visual-cpp-version'] = '''lambda: ['No Visual C/C++ compiler available in this platform.']'''
 gOSEnv['nt']['python-version'] = 'getPythonVersion'
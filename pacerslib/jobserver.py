@@ -0,0 +1,93 @@
+################################################################################
+# jobserver.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, errno
+if os.name=='posix':
+    import fcntl
+
+############################################
+# GNU make jobserver functions
+# A jobserver is a pipe filled with one token (byte) per job slot.
+# A build worker takes a token before building a project, and the make invoked by the build
+# uses that token as its implicit job slot and reads more tokens from the pipe for parallel jobs.
+# Tokens are returned to the pipe when jobs finish, so the number of all running jobs never exceeds
+# the number of tokens.
+# jobServer: (readFd, writeFd) or None
+
+def createJobServer(numJobs):
+    if os.name!='posix':
+        return None
+    readFd, writeFd = os.pipe()
+    os.write(writeFd, '+'*numJobs)
+    # do not leak the pipe to processes other than make
+    setJobServerInheritable((readFd, writeFd), False)
+    return (readFd, writeFd)
+
+def closeJobServer(jobServer):
+    if jobServer==None:
+        return
+    for fd in jobServer:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+def setJobServerInheritable(jobServer, inheritable):
+    for fd in jobServer:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+        if inheritable:
+            fcntl.fcntl(fd, fcntl.F_SETFD, flags & ~fcntl.FD_CLOEXEC)
+        else:
+            fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+def getJobServerMakeFlags(jobServer):
+    # --jobserver-fds for make < 4.2, --jobserver-auth for make >= 4.2
+    return ' -j --jobserver-fds=%d,%d --jobserver-auth=%d,%d'%(jobServer[0], jobServer[1], jobServer[0], jobServer[1])
+
+def acquireJobToken(jobServer):
+    while True:
+        try:
+            return os.read(jobServer[0], 1)
+        except OSError as e:
+            if e.errno!=errno.EINTR:
+                raise
+
+def releaseJobToken(jobServer, token):
+    os.write(jobServer[1], token)
+
+def beginJobServerBuild(jobServer):
+    # take a token and expose the jobserver to make processes started until endJobServerBuild().
+    # return the state to be passed to endJobServerBuild().
+    if jobServer==None:
+        return None
+    token = acquireJobToken(jobServer)
+    prevMakeFlags = os.environ.get('MAKEFLAGS')
+    os.environ['MAKEFLAGS'] = getJobServerMakeFlags(jobServer)
+    setJobServerInheritable(jobServer, True)
+    return (token, prevMakeFlags)
+
+def endJobServerBuild(jobServer, state):
+    if jobServer==None:
+        return
+    token, prevMakeFlags = state
+    setJobServerInheritable(jobServer, False)
+    if prevMakeFlags==None:
+        del os.environ['MAKEFLAGS']
+    else:
+        os.environ['MAKEFLAGS'] = prevMakeFlags
+    releaseJobToken(jobServer, token)
@@ -33,7 +33,12 @@ def getProjLogPrefix(processedCount, numAllProjs, submissionIndex, submissionTit
         # return '%s[%d/%d [%d]%s %s]'%(gLogPrefix, processedCount, numAllProjs, submissionIndex, submissionTitle, gSubmissionTypeName[submissionType])
         return '%s[%d/%d %s %s]'%(gLogPrefix, processedCount, numAllProjs, submissionTitle, gSubmissionTypeName[submissionType])
 
-def printBuildResult(processedCount, numAllProjs, projInfo, buildRetCode, buildLog):
+def getBuildTimeStr(buildTime):
+    if buildTime==None:
+        return ''
+    return ' (%.2f s)'%buildTime
+
+def printBuildResult(processedCount, numAllProjs, projInfo, buildRetCode, buildLog, buildTime=None):
     submissionIndex = projInfo['submissionIndex']
     submissionTitle = projInfo['submissionTitle']
     submissionType = projInfo['submissionType']
@@ -48,11 +53,13 @@ def printBuildResult(processedCount, numAllProjs, projInfo, buildRetCode, buildL
     logPrefix = getProjLogPrefix(processedCount, numAllProjs, submissionIndex, submissionTitle, submissionType, projIndex, projName, numProjInSubmission)
 
     if buildRetCode==0:
-        print '%s Build succeeded.'%logPrefix
+        print '%s Build succeeded.%s'%(logPrefix, getBuildTimeStr(buildTime))
     elif buildRetCode==-1:
         print '%s Build failed. %s'%(logPrefix, buildLog)
+    elif buildRetCode==gBuildTimeoutRetCode:
+        print '%s Build was stopped due to build timeout.%s'%(logPrefix, getBuildTimeStr(buildTime))
     else:
-        print '%s Build failed. A build error occurred.'%logPrefix
+        print '%s Build failed. A build error occurred.%s'%(logPrefix, getBuildTimeStr(buildTime))
 
 def printBuildStart(processedCount, numAllProjs, projInfo):
     submissionIndex = projInfo['submissionIndex']
@@ -70,7 +77,7 @@ def printBuildStart(processedCount, numAllProjs, projInfo):
 
     print '%s Starting build...'%logPrefix
 
-def printRunResult(processedCount, numAllProjs, projInfo, exitTypeList, stdoutStrList):
+def printRunResult(processedCount, numAllProjs, projInfo, exitTypeList, stdoutStrList, runStatList=None):
     submissionIndex = projInfo['submissionIndex']
     submissionTitle = projInfo['submissionTitle']
     submissionType = projInfo['submissionType']
@@ -93,6 +100,11 @@ def printRunResult(processedCount, numAllProjs, projInfo, exitTypeList, stdoutSt
     else:
         raise NotImplementedError
 
+    if runStatList!=None:
+        numStragglers = sum([runStat['numStragglers'] for runStat in runStatList if runStat!=None])
+        if numStragglers > 0:
+            print '%s %d process(es) left running by the program were killed.'%(logPrefix, numStragglers)
+
 def printRunStart(processedCount, numAllProjs, projInfo):
     submissionIndex = projInfo['submissionIndex']
     submissionTitle = projInfo['submissionTitle']
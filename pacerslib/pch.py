@@ -0,0 +1,191 @@
+################################################################################
+# pch.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, re, shutil, subprocess
+from global_const import *
+from unicode import *
+from buildcmd import *
+
+############################################
+# shared precompiled header functions
+# Most submissions start with the same system header (<bits/stdc++.h>, <stdio.h>, ...).
+# PACERs finds the most frequent leading system include of each language, precompiles it once
+# for each set of compiler flags, and forces it (-include) into the compilation of sources
+# whose first include is that header, so that the compiler loads the precompiled header instead
+# of parsing the header again.
+# If a precompiled header cannot be used by a compilation (different compiler or options),
+# gcc silently includes the header text instead, which is what the source would include anyway.
+#
+# precompiledHeaders (args.precompiled_headers):
+#   {language: (headerName, {compilerFlags: pchHeaderPath})}
+#   language: 'c' or 'c++'
+
+gPchHeaderName = 'pacers-pch.h'
+
+gLeadingIncludeRe = re.compile(r'^#\s*include\s*<([^>]+)>')
+
+def getSourceLanguage(fileName):
+    # return 'c', 'c++' or None if fileName is not a C/C++ source file
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension not in gSourceExt or gSourceExt[extension]['build-single-source-func']!='build_single_c_cpp':
+        return None
+    if extension=='.c':
+        return 'c'
+    return 'c++'
+
+def getLeadingInclude(srcPath):
+    # return the header name of the first #include <...> directive of srcPath,
+    # or None if anything other than comments and blank lines precedes it.
+    try:
+        with open(toString(srcPath), 'r') as f:
+            inBlockComment = False
+            for line in f:
+                line = line.strip()
+                if inBlockComment:
+                    if '*/' not in line:
+                        continue
+                    line = line[line.index('*/')+2:].strip()
+                    inBlockComment = False
+                if line.startswith('/*'):
+                    if '*/' not in line:
+                        inBlockComment = True
+                        continue
+                    line = line[line.index('*/')+2:].strip()
+                if line=='' or line.startswith('//'):
+                    continue
+                m = gLeadingIncludeRe.match(line)
+                if m:
+                    return m.group(1).strip()
+                return None
+    except (IOError, OSError):
+        pass
+    return None
+
+def getPchSourceFiles(projInfo):
+    # return [(language, source path), ...] of C/C++ sources of a project that can use a precompiled header
+    submissionType = projInfo['submissionType']
+    if submissionType==SINGLE_SOURCE_FILE or submissionType==SOURCE_FILES:
+        return getCSourceFiles(projInfo['submissionDir'], projInfo['filesInProj'][:1])
+    elif submissionType==CMAKE_PROJECT:
+        return getCSourceFiles(projInfo['submissionDir'], projInfo['filesInProj'])
+    return []
+
+def getCSourceFiles(srcRootDir, fileNames):
+    srcFiles = []
+    for fileName in fileNames:
+        language = getSourceLanguage(fileName)
+        if language!=None:
+            srcFiles.append((language, opjoin(srcRootDir, fileName)))
+    return srcFiles
+
+def getPchCompilerFlags(projInfo, args):
+    # compiler flags of the compilations of a project, which must match the ones of its precompiled header
+    if projInfo['submissionType']!=CMAKE_PROJECT and args.single_source_builder=='compiler':
+        return args.compiler_flags
+    return ''
+
+def getMostFrequentLeadingIncludes(allProjInfos):
+    # return {language: (headerName, count)} of the most frequent leading includes
+    counts = {}
+    for projInfo in allProjInfos:
+        for language, srcPath in getPchSourceFiles(projInfo):
+            headerName = getLeadingInclude(srcPath)
+            if headerName==None:
+                continue
+            if language not in counts:
+                counts[language] = {}
+            counts[language][headerName] = counts[language].get(headerName, 0) + 1
+
+    mostFrequent = {}
+    for language in counts:
+        headerName = max(sorted(counts[language]), key=lambda name: counts[language][name])
+        mostFrequent[language] = (headerName, counts[language][headerName])
+    return mostFrequent
+
+def buildPrecompiledHeaders(allProjInfos, pchDir, args):
+    # return precompiledHeaders. headers included by only one source are not precompiled.
+    precompiledHeaders = {}
+    if os.name!='posix':
+        return precompiledHeaders
+
+    try:
+        if os.path.exists(pchDir):
+            shutil.rmtree(pchDir)
+        os.makedirs(pchDir)
+    except (IOError, OSError):
+        return precompiledHeaders
+
+    mostFrequent = getMostFrequentLeadingIncludes(allProjInfos)
+    for language in sorted(mostFrequent):
+        headerName, count = mostFrequent[language]
+        if count < 2:
+            continue
+        flagsSet = sorted(set([getPchCompilerFlags(projInfo, args) for projInfo in allProjInfos]))
+        pchHeaderPaths = {}
+        for flags in flagsSet:
+            headerDir = opjoin(pchDir, '%s-%d'%(language.replace('+', 'x'), len(pchHeaderPaths)))
+            if buildPrecompiledHeader(headerDir, language, headerName, flags, args):
+                pchHeaderPaths[flags] = opjoin(headerDir, gPchHeaderName)
+        if len(pchHeaderPaths) > 0:
+            precompiledHeaders[language] = (headerName, pchHeaderPaths)
+    return precompiledHeaders
+
+def buildPrecompiledHeader(headerDir, language, headerName, compilerFlags, args):
+    if language=='c':
+        compilerCmd = args.c_compiler_cmd
+    else:
+        compilerCmd = args.cpp_compiler_cmd
+    try:
+        os.makedirs(headerDir)
+        with open(toString(opjoin(headerDir, gPchHeaderName)), 'w') as f:
+            f.write(toString(u'#include <%s>\n'%headerName))
+        checkBuildOutput('cd "%s" && %s -x %s-header %s -o %s.gch %s'
+                %(toString(headerDir), compilerCmd, language, gPchHeaderName, gPchHeaderName, compilerFlags), args.build_timeout)
+    except (IOError, OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+def getPchHeaderPath(precompiledHeaders, language, srcPaths, compilerFlags):
+    # return the precompiled header to be forced into the compilation of srcPaths, which are sources of language,
+    # or None if any of srcPaths does not start with the precompiled header.
+    if precompiledHeaders==None or language not in precompiledHeaders or len(srcPaths)==0:
+        return None
+    headerName, pchHeaderPaths = precompiledHeaders[language]
+    if compilerFlags not in pchHeaderPaths:
+        return None
+    for srcPath in srcPaths:
+        if getLeadingInclude(srcPath)!=headerName:
+            return None
+    return os.path.abspath(pchHeaderPaths[compilerFlags])
+
+def getPchCompilerFlag(pchHeaderPath):
+    if pchHeaderPath==None:
+        return ''
+    return '-include "%s"'%pchHeaderPath
+
+def getPchCMakeArgs(precompiledHeaders, srcFiles, compilerFlags):
+    # return cmake arguments that force precompiled headers into all srcFiles of a CMake project
+    srcPathsOfLanguage = {}
+    for language, srcPath in srcFiles:
+        srcPathsOfLanguage.setdefault(language, []).append(srcPath)
+    cmakeArgs = ''
+    for language in sorted(srcPathsOfLanguage):
+        pchHeaderPath = getPchHeaderPath(precompiledHeaders, language, srcPathsOfLanguage[language], compilerFlags)
+        if pchHeaderPath!=None:
+            cmakeArgs += ' "-DCMAKE_%s_FLAGS=-include \\"%s\\""'%('C' if language=='c' else 'CXX', pchHeaderPath)
+    return cmakeArgs
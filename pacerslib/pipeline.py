@@ -0,0 +1,169 @@
+################################################################################
+# pipeline.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import time, collections, traceback, Queue
+import multiprocessing as mp
+from build import *
+from run import *
+
+############################################
+# pipelined build & run functions
+# Instead of a build phase followed by a run phase, build tasks and run tasks share numWorkers
+# worker processes, and the run tasks of a project are queued as soon as its build finishes.
+# Each worker has its own task queue, so the scheduler decides which worker gets which task:
+# a free worker takes a queued run task first (one of the projects it has built if preferBuilder is True,
+# whose files are still hot in the page cache), and then a build task.
+#
+# task: (kind, key, params) sent to a worker
+#   ('build', projIndex, (projInfo, args))
+#   ('run', (projIndex, caseIndex), (projInfo, caseIndex, stdInput, cmdArg, timeOut, interpreterCmd, preShellCmd, outputLimits))
+# a worker returns (workerIndex, kind, key, result) where result is
+#   (buildRetCode, buildLog, buildVersion, buildTime) for a build task
+#   (exitType, stdoutStr, runStat) for a run task
+# If a worker dies (e.g. killed by the OOM killer), its task fails with gWorkerDiedMsg and the worker is restarted.
+
+# seconds between liveness checks of the workers while waiting for results
+gPipelinePollInterval = 1.
+
+def runPipeline(projInfos, buildIndices, runIndices, args, numWorkers, preferBuilder, onBuildFinished, onProjFinished, runCpus=None):
+    # build projInfos[i] for i in buildIndices and run them after their builds, and run projInfos[i] for i in runIndices.
+    # onBuildFinished(i, buildRetCode, buildLog, buildVersion, buildTime) is called when projInfos[i] is built,
+    # and returns True if projInfos[i] is to be run.
+    # onProjFinished(i, exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList) is called
+    # when all runs of projInfos[i] are finished.
+    # if runCpus is given, the run tasks of worker k are pinned to runCpus[k % len(runCpus)],
+    # and builds may use all of runCpus.
+    resultQueue = mp.Queue()
+    workers = [startPipelineWorker(workerIndex, resultQueue, runCpus) for workerIndex in range(numWorkers)]
+
+    buildTasks = collections.deque([('build', i, (projInfos[i], args)) for i in buildIndices])
+    runTasks = collections.deque()
+    projStates = {}
+    builderOf = {}  # projIndex -> index of the worker that built it
+    idleWorkers = collections.deque(range(numWorkers))
+    inFlightTasks = {}  # workerIndex -> task
+
+    def queueRuns(i):
+        runCases = getRunCases(projInfos[i]['stdInputs'], projInfos[i]['cmdArgss'])
+        projStates[i] = {'runCases':runCases, 'numFinished':0,
+                         'exitTypeList':[None]*len(runCases), 'stdoutStrList':[None]*len(runCases), 'runStatList':[None]*len(runCases)}
+        if isProjStateFinished(projStates[i]):
+            onProjFinished(i, *getProjStateRunResult(projStates[i]))
+        for caseIndex in range(len(runCases)):
+            stdInput, cmdArg = runCases[caseIndex]
+            runTasks.append(('run', (i, caseIndex), (projInfos[i], caseIndex, stdInput, cmdArg,
+                             args.timeout, args.interpreter_cmd, args.pre_shell_cmd, args.output_limits)))
+
+    for i in runIndices:
+        queueRuns(i)
+
+    try:
+        while len(buildTasks) > 0 or len(runTasks) > 0 or len(inFlightTasks) > 0:
+            # give tasks to idle workers
+            while len(idleWorkers) > 0 and (len(buildTasks) > 0 or len(runTasks) > 0):
+                workerIndex = idleWorkers.popleft()
+                task = popTaskForWorker(workerIndex, buildTasks, runTasks, builderOf if preferBuilder else None)
+                workers[workerIndex][1].put(task)
+                inFlightTasks[workerIndex] = task
+
+            try:
+                workerIndex, kind, key, result = resultQueue.get(timeout=gPipelinePollInterval)
+            except Queue.Empty:
+                workerIndex, kind, key, result = getLostTaskResult(workers, inFlightTasks)
+                if workerIndex==None:
+                    continue
+                # replace the dead worker
+                workers[workerIndex] = startPipelineWorker(workerIndex, resultQueue, runCpus)
+            if inFlightTasks.get(workerIndex)==None or inFlightTasks[workerIndex][1]!=key:
+                # a late result of a task already reported as lost
+                continue
+            del inFlightTasks[workerIndex]
+            idleWorkers.append(workerIndex)
+
+            if kind=='build':
+                builderOf[key] = workerIndex
+                if onBuildFinished(key, *result):
+                    queueRuns(key)
+            else:
+                projIndex, caseIndex = key
+                if addRunTaskResult(projStates[projIndex], caseIndex, *result):
+                    onProjFinished(projIndex, *getProjStateRunResult(projStates[projIndex]))
+    finally:
+        for process, taskQueue in workers:
+            taskQueue.put(None)
+        for process, taskQueue in workers:
+            process.join(gPipelinePollInterval)
+
+def startPipelineWorker(workerIndex, resultQueue, runCpus):
+    # return (process, taskQueue) of a new worker
+    taskQueue = mp.Queue()
+    process = mp.Process(target=pipelineWorkerMain, args=(workerIndex, taskQueue, resultQueue, runCpus))
+    process.daemon = True
+    process.start()
+    return process, taskQueue
+
+def getLostTaskResult(workers, inFlightTasks):
+    # return workerIndex, kind, key, result of the task of a dead worker as a failed build or run,
+    # or None, None, None, None if all workers with tasks are alive
+    for workerIndex, task in inFlightTasks.items():
+        process = workers[workerIndex][0]
+        if not process.is_alive():
+            kind, key, params = task
+            msg = gWorkerDiedMsg%process.exitcode
+            if kind=='build':
+                return workerIndex, kind, key, (-1, msg, 'no-build-version', None)
+            return workerIndex, kind, key, (-1, msg, None)
+    return None, None, None, None
+
+def popTaskForWorker(workerIndex, buildTasks, runTasks, builderOf):
+    # run tasks first so that the results of built projects come out early
+    if len(runTasks) > 0:
+        if builderOf!=None:
+            for task in runTasks:
+                if builderOf.get(task[1][0])==workerIndex:
+                    runTasks.remove(task)
+                    return task
+        return runTasks.popleft()
+    return buildTasks.popleft()
+
+def pipelineWorkerMain(workerIndex, taskQueue, resultQueue, runCpus):
+    cpu = None
+    if runCpus!=None:
+        # workers are forked from PACERs pinned to its own cpu
+        setCpuAffinity(0, runCpus)
+        cpu = runCpus[workerIndex % len(runCpus)]
+    while True:
+        task = taskQueue.get()
+        if task==None:
+            break
+        kind, key, params = task
+        try:
+            if kind=='build':
+                projInfo, args = params
+                startTime = time.time()
+                buildRetCode, buildLog, buildVersion = buildOneProj(projInfo, args)
+                result = (buildRetCode, buildLog, buildVersion, time.time()-startTime)
+            else:
+                result = runOneTask(*(params+(cpu,)))
+        except Exception:
+            # the scheduler waits for a result of every task
+            if kind=='build':
+                result = (-1, toUnicode(traceback.format_exc()), 'no-build-version', None)
+            else:
+                result = (-1, toUnicode(traceback.format_exc()), None)
+        resultQueue.put((workerIndex, kind, key, result))
@@ -0,0 +1,108 @@
+################################################################################
+# pool.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, shutil, tempfile
+import multiprocessing as mp
+from unicode import *
+from affinity import *
+
+############################################
+# session worker pool functions
+# PACERs creates one worker pool for a session, which is used by the parallel build phase and
+# the parallel run phase (RUN_ENGINE pool), and closed when the session is finished.
+# Tasks are sent with imap_unordered(), and the result of each task comes back directly
+# to the main process as soon as its chunk of tasks is finished.
+# The pool may be created after PACERs has pinned itself to its cpu core (--pin-cores),
+# so each worker resets its affinity to workerCpus when it starts.
+
+# each worker gets about gChunksPerWorker chunks of tasks, as in Pool.map()
+gChunksPerWorker = 4
+
+gSessionPool = None
+
+def getSessionPool(numWorkers, workerCpus=None):
+    # create the session pool with numWorkers worker processes for the first call
+    global gSessionPool
+    if gSessionPool==None:
+        gSessionPool = mp.Pool(numWorkers, initPoolWorker, (workerCpus,))
+    return gSessionPool
+
+def initPoolWorker(workerCpus):
+    if workerCpus!=None:
+        setCpuAffinity(0, workerCpus)
+
+def closeSessionPool():
+    global gSessionPool
+    if gSessionPool!=None:
+        gSessionPool.close()
+        gSessionPool.join()
+        gSessionPool = None
+
+def getChunkSize(numTasks, numWorkers):
+    return max(1, numTasks / (numWorkers*gChunksPerWorker))
+
+def iterCpuGatedTasks(tasks, freeCpus):
+    # yield task+(cpu,) for each task in tasks.
+    # if freeCpus (a Queue.Queue of run CPUs) is given, each task waits for a free CPU taken from freeCpus,
+    # which the caller puts back when the result of the task comes back,
+    # so that no more tasks than run CPUs are in flight even if the pool has more workers.
+    # use chunksize 1 with freeCpus.
+    for task in tasks:
+        if freeCpus==None:
+            yield task+(None,)
+        else:
+            yield task+(freeCpus.get(),)
+
+############################################
+# payload spooling
+# With --spool-size, a build log or an output of a target program larger than SPOOL_SIZE
+# is not pickled back from a worker: the worker writes it to a file in the spool directory
+# and returns a SpooledPayload instead, which is read (and removed) by the main process.
+
+class SpooledPayload(object):
+    def __init__(self, path, isUnicode):
+        self.path = path
+        self.isUnicode = isUnicode
+
+def createSpoolDir(tmpfsDir):
+    # return the path of a new spool directory in tmpfsDir, or in the default temp directory if tmpfsDir is not available
+    if not os.path.isdir(tmpfsDir):
+        tmpfsDir = None
+    return tempfile.mkdtemp(prefix='pacers-spool-', dir=toString(tmpfsDir) if tmpfsDir!=None else None)
+
+def removeSpoolDir(spoolDir):
+    shutil.rmtree(spoolDir, ignore_errors=True)
+
+def spoolPayload(payload, spoolDir, spoolSize):
+    # return a SpooledPayload if payload is longer than spoolSize, or payload itself
+    if spoolDir==None or spoolSize<=0 or not isinstance(payload, basestring) or len(payload)<=spoolSize:
+        return payload
+    isUnicode = isinstance(payload, unicode)
+    fd, path = tempfile.mkstemp(dir=spoolDir)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(payload.encode('utf-8') if isUnicode else payload)
+    return SpooledPayload(path, isUnicode)
+
+def unspoolPayload(payload):
+    # return the original payload of a SpooledPayload, or payload itself
+    if not isinstance(payload, SpooledPayload):
+        return payload
+    with open(payload.path, 'rb') as f:
+        data = f.read()
+    os.remove(payload.path)
+    return data.decode('utf-8') if payload.isUnicode else data
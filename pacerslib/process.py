@@ -171,6 +171,7 @@ def generateReportDataForAllProjs(allProjInfos, buildResults, runResults, destDi
     cmdArgsLists = []
     submissionTypes = []
     buildVersionSet = set()
+    runStatLists = []
 
     for i in range(len(allProjInfos)):
         projInfo = allProjInfos[i]
@@ -181,7 +182,7 @@ def generateReportDataForAllProjs(allProjInfos, buildResults, runResults, destDi
 
         buildRetCode, buildLog, buildVersion = buildResults[i]
 
-        exitTypeList, stdoutStrList, stdInputList, cmdArgsList = runResults[i]
+        exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList = runResults[i]
 
         # add report data
         submittedFileNames.append(submissionTitle)
@@ -211,8 +212,9 @@ def generateReportDataForAllProjs(allProjInfos, buildResults, runResults, destDi
         cmdArgsLists.append(cmdArgsList)
         submissionTypes.append(submissionType)
         buildVersionSet.add(buildVersion)
+        runStatLists.append(runStatList)
 
-    return submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, stdInputLists, cmdArgsLists, submissionTypes, buildVersionSet
+    return submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, stdInputLists, cmdArgsLists, submissionTypes, buildVersionSet, runStatLists
 
 ############################################
 # project type detection
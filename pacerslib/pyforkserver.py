@@ -0,0 +1,211 @@
+################################################################################
+# pyforkserver.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+# Python fork server started by forkserver.py with INTERPRETER_CMD (Linux only).
+# This script is run by the interpreter of the submissions, so it must work with both python 2 and 3,
+# and must not import anything from pacerslib. Do not add 'from __future__ import print_function':
+# the scripts of submissions are compiled with the future flags of this module.
+#
+# protocol (one json object per line):
+#   request (stdin)     {"script":path, "args":[arg, ...], "cwd":path, "fds":[stdin path, stdout path, stderr path]}
+#   response (stdout)   {"type":"started", "pid":pid} or {"type":"error", "msg":message}, in the order of requests
+#                       {"type":"exited", "pid":pid, "status":wait status, "utime":s, "stime":s, "maxrss":n} when a child exits
+import os, sys, json, select, signal, errno, fcntl, runpy, types
+
+def main():
+    # keep the control channel away from fd 0 and 1, which are replaced in children
+    ctrlIn = os.dup(0)
+    ctrlOut = os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    # SIGCHLD wakes up select() through wakeR
+    wakeR, wakeW = os.pipe()
+    for fd in [wakeR, wakeW]:
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.set_wakeup_fd(wakeW)
+
+    buf = b''
+    while True:
+        try:
+            readable = select.select([ctrlIn, wakeR], [], [])[0]
+        except (select.error, OSError) as e:
+            if e.args[0]!=errno.EINTR:
+                raise
+            readable = []
+
+        if wakeR in readable:
+            try:
+                os.read(wakeR, 4096)
+            except OSError:
+                pass
+        reapChildren(ctrlOut)
+
+        if ctrlIn in readable:
+            data = os.read(ctrlIn, 1<<16)
+            if not data:
+                # PACERs has exited
+                break
+            buf += data
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                request = json.loads(line.decode('utf-8'))
+                startChild(request, ctrlOut, [ctrlIn, ctrlOut, wakeR, wakeW])
+
+def send(ctrlOut, message):
+    data = (json.dumps(message)+'\n').encode('utf-8')
+    while data:
+        try:
+            data = data[os.write(ctrlOut, data):]
+        except OSError as e:
+            if e.errno!=errno.EINTR:
+                raise
+
+def reapChildren(ctrlOut):
+    while True:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except OSError as e:
+            if e.errno==errno.EINTR:
+                continue
+            return
+        if pid==0:
+            return
+        send(ctrlOut, {'type':'exited', 'pid':pid, 'status':status,
+                       'utime':rusage.ru_utime, 'stime':rusage.ru_stime, 'maxrss':rusage.ru_maxrss})
+
+def startChild(request, ctrlOut, serverFds):
+    try:
+        fds = [os.open(request['fds'][0], os.O_RDONLY), os.open(request['fds'][1], os.O_WRONLY), os.open(request['fds'][2], os.O_WRONLY)]
+    except OSError as e:
+        send(ctrlOut, {'type':'error', 'msg':str(e)})
+        return
+    try:
+        pid = os.fork()
+    except OSError as e:
+        for fd in fds:
+            os.close(fd)
+        send(ctrlOut, {'type':'error', 'msg':str(e)})
+        return
+
+    if pid==0:
+        try:
+            runChild(request, fds, serverFds)
+        finally:
+            os._exit(1)
+
+    for fd in fds:
+        os.close(fd)
+    send(ctrlOut, {'type':'started', 'pid':pid})
+
+def runChild(request, fds, serverFds):
+    # same as 'INTERPRETER_CMD script args' started with preexec_fn=os.setsid in cwd
+    os.setsid()
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for i in range(3):
+        os.dup2(fds[i], i)
+    for fd in fds + serverFds:
+        os.close(fd)
+
+    script = request['script']
+    args = request['args']
+    if sys.version_info[0] < 3:
+        # json strings are unicode in python 2, but sys.argv and __file__ are byte strings
+        script = script.encode(sys.getfilesystemencoding())
+        args = [arg.encode(sys.getfilesystemencoding()) for arg in args]
+    os.chdir(request['cwd'])
+    sys.argv = [script] + args
+    sys.path[0] = os.path.dirname(script)
+
+    exitCode = 0
+    try:
+        runScript(script)
+    except SystemExit as e:
+        exitCode = getExitCode(e)
+    except BaseException:
+        printException(script)
+        exitCode = 1
+    exitCode = shutdownInterpreter(exitCode)
+
+    for f in [sys.stdout, sys.stderr]:
+        try:
+            f.flush()
+        except Exception:
+            pass
+    os._exit(exitCode)
+
+def shutdownInterpreter(exitCode):
+    # do what the interpreter does before it exits, which os._exit() skips:
+    # wait for non-daemon threads and call atexit handlers. return the exit code.
+    threading = sys.modules.get('threading')
+    if threading is not None:
+        try:
+            threading._shutdown()
+        except BaseException:
+            pass
+    try:
+        if sys.version_info[0] >= 3:
+            # prints exceptions of the handlers and ignores SystemExit
+            import atexit
+            atexit._run_exitfuncs()
+        elif hasattr(sys, 'exitfunc'):
+            sys.exitfunc()
+    except SystemExit as e:
+        # python 2 exits with the code of SystemExit raised from sys.exitfunc
+        exitCode = getExitCode(e)
+    except BaseException:
+        # the interpreter prints the exception and keeps the exit code
+        sys.stderr.write('Error in sys.exitfunc:\n')
+        sys.excepthook(*sys.exc_info())
+    return exitCode
+
+def runScript(script):
+    if sys.version_info[0] >= 3:
+        runpy.run_path(script, run_name='__main__')
+        return
+    # python 2 - runpy compiles the source with compile(), which skips the source encoding check (PEP 263)
+    # and reports some syntax errors differently. execfile() reads the file as the interpreter does.
+    module = types.ModuleType('__main__')
+    module.__file__ = script
+    sys.modules['__main__'] = module
+    execfile(script, module.__dict__)
+
+def getExitCode(e):
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    sys.stderr.write('%s\n'%e.code)
+    return 1
+
+def printException(script):
+    # print the traceback without the frames of this server by sys.excepthook, as the interpreter does
+    etype, value, tb = sys.exc_info()
+    while tb is not None and tb.tb_frame.f_code.co_filename!=script:
+        tb = tb.tb_next
+    if sys.version_info[0] >= 3:
+        # python 3 prints the traceback attached to the exception
+        value = value.with_traceback(tb)
+    sys.excepthook(etype, value, tb)
+
+if __name__=='__main__':
+    main()
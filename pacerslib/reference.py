@@ -0,0 +1,77 @@
+################################################################################
+# reference.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, shutil
+from global_const import *
+from unicode import *
+from process import *
+
+############################################
+# reference solution functions
+# The reference (an instructor solution, in any form of a submission) is copied into
+# <OUTPUT_DIR>/<ASSIGNMENT_ALIAS>/pacers-reference/, built and run before all submissions
+# for each input case, and the timeout of each case is derived from its run time.
+#
+# referenceTimeOut (an element of args.reference_timeouts):
+#   {'referenceTime':seconds or None, 'timeOut':seconds}
+#   referenceTime - wall time of the reference, None if it did not finish normally.
+#   timeOut - max(referenceTime * REFERENCE_TIMEOUT_FACTOR, REFERENCE_TIMEOUT_FLOOR),
+#             or TIMEOUT if referenceTime is None.
+
+def collectReferenceProjInfo(referencePath, refDir, exclude_patterns, std_input, cmd_args, deco2unicoMap):
+    # return projInfo of the reference, errorMsg.
+    # referencePath is copied into refDir if it has not been copied yet (--run-only),
+    # and the copy is unidecoded as the copies of submissions in destDir are.
+    referencePath = os.path.abspath(referencePath)
+    if not os.path.exists(referencePath):
+        return None, 'Unable to access \'%s\'.'%referencePath
+
+    refTitle = os.path.basename(referencePath)
+    if not os.path.exists(opjoin(refDir, unico2decoPath(refTitle, deco2unicoMap))):
+        # Convert paths for shutil to byte string only for posix os (due to python bug?)
+        if os.name=='posix':
+            src, dst = toString(referencePath), toString(opjoin(refDir, refTitle))
+        else:
+            src, dst = referencePath, opjoin(refDir, refTitle)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst)
+        else:
+            if not os.path.isdir(os.path.dirname(dst)):
+                os.makedirs(os.path.dirname(dst))
+            shutil.copy2(src, dst)
+
+    projInfos = collectAllProjInfosInAllSubmissions([refTitle], os.path.dirname(referencePath), exclude_patterns, std_input, cmd_args, refDir, deco2unicoMap)
+    if len(projInfos)!=1:
+        return None, 'The reference \'%s\' must have exactly one project (%d found).'%(referencePath, len(projInfos))
+    return projInfos[0], None
+
+def getReferenceTimeOuts(exitTypeList, runStatList, timeOut, factor, floor):
+    # return a list of referenceTimeOut, one for each input case
+    referenceTimeOuts = []
+    for i in range(len(exitTypeList)):
+        if exitTypeList[i]==0 and runStatList[i]!=None:
+            referenceTime = runStatList[i]['wallTime']
+            referenceTimeOuts.append({'referenceTime':referenceTime, 'timeOut':max(referenceTime*factor, floor)})
+        else:
+            referenceTimeOuts.append({'referenceTime':None, 'timeOut':timeOut})
+    return referenceTimeOuts
+
+def getReferenceTimeOutStr(caseIndex, referenceTimeOut):
+    if referenceTimeOut['referenceTime']==None:
+        return 'Case %d: %g s (the reference failed, TIMEOUT is used)'%(caseIndex+1, referenceTimeOut['timeOut'])
+    return 'Case %d: %.3f s (reference: %.3f s)'%(caseIndex+1, referenceTimeOut['timeOut'], referenceTimeOut['referenceTime'])
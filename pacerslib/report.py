@@ -23,10 +23,13 @@ from pygments.lexers import guess_lexer_for_filename
 from pygments.formatters import HtmlFormatter
 from pygments.lexers.special import TextLexer
 from global_const import *
+from affinity import *
+from reference import *
+from stdinput import *
 
 ############################################
 # report functions
-def generateReport(args, submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, stdInputLists, cmdArgsLists, submissionTypes, buildVersionSet):
+def generateReport(args, submittedFileNames, srcFileLists, buildRetCodes, buildLogs, exitTypeLists, stdoutStrLists, stdInputLists, cmdArgsLists, submissionTypes, buildVersionSet, buildTimes, runStatLists):
 
     cssCode = HtmlFormatter().get_style_defs()
 
@@ -127,7 +130,11 @@ table.type04 td {
     for buildVersion in buildVersionSet:
         if buildVersion != 'no-build-version':
             htmlCode +='<tr><th>%s</th><td>'%gVersionDescription[buildVersion]
-            for versionText in eval(gOSEnv[os.name][buildVersion])(args.interpreter_cmd, args.pre_shell_cmd):
+            if buildVersion=='compiler-version':
+                versionTexts = eval(gOSEnv[os.name][buildVersion])(args.c_compiler_cmd, args.cpp_compiler_cmd)
+            else:
+                versionTexts = eval(gOSEnv[os.name][buildVersion])(args.interpreter_cmd, args.pre_shell_cmd)
+            for versionText in versionTexts:
                 htmlCode +='%s<br>'%toUnicode(versionText)
             htmlCode +='</td></tr>'
 
@@ -147,11 +154,21 @@ table.type04 td {
     <tr><th>Command line arguments</th> <td>%s</td></tr>
     <!--<tr><th>User dict</th> <td>%s</td></tr>-->
     <tr><th>Timeout</th> <td>%f</td></tr>
+    <tr><th>Reference timeouts</th> <td>%s</td></tr>
+    <tr><th>Build timeout</th> <td>%f</td></tr>
+    <tr><th>Output capture size (KiB)</th> <td>%d</td></tr>
+    <tr><th>Output kill size (KiB)</th> <td>%d</td></tr>
+    <tr><th>Expected output</th> <td>%s</td></tr>
+    <tr><th>CPU pinning</th> <td>%s</td></tr>
     <tr><th>Run only</th> <td>%s</td></tr>
     <tr><th>Build only</th> <td>%s</td></tr>
+    <tr><th>CMake generator</th> <td>%s</td></tr>
+    <tr><th>Workspace</th> <td>%s</td></tr>
     </tbody>
     </table>'''%(os.path.abspath(args.assignment_dir), opjoin(os.path.abspath(args.output_dir), unidecode(args.assignment_alias)), 
-        args.std_input, args.cmd_args, args.user_dict, args.timeout, 'true' if args.run_only else 'false', 'true' if args.build_only else 'false')
+        getStdInputsStr(args.std_input), args.cmd_args, args.user_dict, args.timeout, getReferenceTimeOutsStr(args), args.build_timeout, args.output_capture_size, args.output_kill_size, args.expected_output, getCpuPartitionStr(args.cpu_partition) if args.cpu_partition!=None else 'false', 'true' if args.run_only else 'false', 'true' if args.build_only else 'false',
+        getNinjaVersion() if args.cmake_generator=='ninja' else args.cmake_generator,
+        'tmpfs (%s)'%args.workspace_dir if args.workspace_path!=None else 'output-dir')
 
     # main table
     htmlCode += '''
@@ -162,6 +179,9 @@ table.type04 td {
     <th>Submission Title<br>(Submission Type)</th>
     <th>Source Files</th>
     <th>Output</th>
+    <th>Wall Time (s)</th>
+    <th>CPU Time (s)<br>(user / sys)</th>
+    <th>Max RSS (KiB)<br>(&le;: below the size of<br>the PACERs process<br>that started it)</th>
     <th>Score</th>
     <th>Comment</th>
     </tr>
@@ -171,10 +191,19 @@ table.type04 td {
 
     for i in range(len(submittedFileNames)):
         htmlCode += '<tr>\n'
-        htmlCode += '<th>%s<br>(%s)</th>\n'%(submittedFileNames[i], gSubmissionTypeName[submissionTypes[i]])
+        htmlCode += '<th>%s<br>(%s)'%(submittedFileNames[i], gSubmissionTypeName[submissionTypes[i]])
+        if buildTimes[i]!=None:
+            htmlCode += '<br>Build time: %.2f s'%buildTimes[i]
+        htmlCode += '</th>\n'
         htmlCode += '<td>%s</td>\n'%getSourcesTable(srcFileLists[i], args.assignment_dir, args.output_dir, args.assignment_alias)
         htmlCode += '<td>%s</td>\n'%getOutput(buildRetCodes[i], buildLogs[i], stdInputLists[i], cmdArgsLists[i], exitTypeLists[i], stdoutStrLists[i])
-        htmlCode += '<td>%s</td>\n'%''
+        htmlCode += '<td>%s</td>\n'%getRunStatCell(runStatLists[i], getWallTimeStr)
+        htmlCode += '<td>%s</td>\n'%getRunStatCell(runStatLists[i], getCPUTimeStr)
+        htmlCode += '<td>%s</td>\n'%getRunStatCell(runStatLists[i], getMaxRSSStr)
+        if args.expected_output_paths!=None and not args.build_only:
+            htmlCode += '<td>%s</td>\n'%getScore(buildRetCodes[i], exitTypeLists[i], runStatLists[i])
+        else:
+            htmlCode += '<td>%s</td>\n'%''
         htmlCode += '<td>%s</td>\n'%''
         htmlCode += '</tr>\n'
 
@@ -268,7 +297,7 @@ def getOutput(buildRetCode, buildLog, stdInputList, cmdArgsList, exitTypeList, s
             exitType = exitTypeList[i]
             stdoutStr = stdoutStrList[i]
             if exitType == 0:
-                s += '(STD_INPUT: %s)\n'%stdInput
+                s += '(STD_INPUT: %s)\n'%getStdInputDisplayStr(stdInput)
                 s += '(CMD_ARGS: %s)\n'%cmdArgs
                 # success, unistr = getUnicodeStr(stdoutStr)
                 # s += highlight(unistr, TextLexer(), HtmlFormatter())
@@ -276,11 +305,64 @@ def getOutput(buildRetCode, buildLog, stdInputList, cmdArgsList, exitTypeList, s
             elif exitType == -1:
                 s += highlight(stdoutStr, TextLexer(), HtmlFormatter())
             elif exitType == 1:   # time out
-                s += '(STD_INPUT: %s)\n'%stdInput
+                s += '(STD_INPUT: %s)\n'%getStdInputDisplayStr(stdInput)
                 s += '(CMD_ARGS: %s)\n'%cmdArgs
                 s += 'Timeout'
             s += '\n'
     return s
+
+def getStdInputsStr(stdInputs):
+    # STD_INPUT of the options table. StdInputFiles of --std-input-file and --std-input-dir are shown
+    # one per line by their names, sizes and the head of their contents, as in the Output column.
+    if not any(isStdInputFile(stdInput) for stdInput in stdInputs):
+        return stdInputs
+    return '<br>'.join([getStdInputDisplayStr(stdInput).rstrip('\n').replace('\n', '<br>') for stdInput in stdInputs])
+
+# one line for each run of a project, in the order of the runs in the Output column
+def getRunStatCell(runStatList, getStatStr):
+    return '<br>'.join([getStatStr(runStat) if runStat!=None else '-' for runStat in runStatList])
+
+def getWallTimeStr(runStat):
+    return '%.3f'%runStat['wallTime']
+
+def getCPUTimeStr(runStat):
+    if runStat['userTime']==None:
+        return '-'
+    return '%.3f / %.3f'%(runStat['userTime'], runStat['sysTime'])
+
+def getMaxRSSStr(runStat):
+    if runStat['maxRSS']==None:
+        return '-'
+    if runStat.get('maxRSSFloor')!=None and runStat['maxRSS'] <= runStat['maxRSSFloor']:
+        # the program used less memory than the forked PACERs process it was started from
+        return '&le; %d'%runStat['maxRSS']
+    return '%d'%runStat['maxRSS']
+
+def getReferenceTimeOutsStr(args):
+    if args.reference_timeouts==None:
+        return 'None'
+    s = '%s<br>'%args.reference
+    s += 'max(%g * reference, %g)<br>'%(args.reference_timeout_factor, args.reference_timeout_floor)
+    s += '<br>'.join([getReferenceTimeOutStr(i, args.reference_timeouts[i]) for i in range(len(args.reference_timeouts))])
+    return s
+
+# the number of passed runs, followed by the verdict of each run as in getRunStatCell()
+def getScore(buildRetCode, exitTypeList, runStatList):
+    if buildRetCode!=0:
+        return 'fail (build error)'
+    verdicts = [getVerdict(exitTypeList[i], runStatList[i]) for i in range(len(exitTypeList))]
+    return '%d / %d passed<br>'%(verdicts.count('pass'), len(verdicts)) + '<br>'.join(verdicts)
+
+def getVerdict(exitType, runStat):
+    if runStat==None or runStat['outputCheck']==None:
+        return 'fail (error)'
+    if exitType==1:
+        return 'fail (timeout)'
+    if runStat['outputCheck']['diffOffset']!=None:
+        return 'fail (differs at byte %d)'%runStat['outputCheck']['diffOffset']
+    if exitType==-1:
+        return 'fail (error)'
+    return 'pass'
  
 # def getUnicodeStr(str):
     # success = True
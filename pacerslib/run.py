@@ -16,65 +16,245 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
-import os, subprocess, threading, glob, re, shlex
+import os, subprocess, threading, glob, re, shlex, collections, time
 from global_const import *
 from unicode import *
-
-def runOneProj(projInfo, timeOut, interpreterCmd, preShellCmd):
-    submissionType = projInfo['submissionType']
-    projName = projInfo['projName']
-    submissionDir = projInfo['submissionDir']
-    filesInProj = projInfo['filesInProj']
+from file import *
+from supervisor import *
+from forkserver import *
+from check import *
+from affinity import *
+from stdinput import *
+
+def runOneProj(projInfo, timeOut, interpreterCmd, preShellCmd, outputLimits, cpu=None):
     stdInputs = projInfo['stdInputs']
     cmdArgss = projInfo['cmdArgss']
+    runcmd, runcwd, errorMsg = getProjRunCmdAndCwd(projInfo, interpreterCmd)
+
+    exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList = runProj(runcmd, runcwd, errorMsg, stdInputs, cmdArgss, timeOut, preShellCmd, outputLimits, projInfo.get('forkServerCmd'), projInfo.get('expectedOutputPaths'), cpu, projInfo.get('timeOuts'))
 
-    exitTypeList, stdoutStrList, stdInputList, cmdArgsList = runProj(submissionType, submissionDir, projName, filesInProj, stdInputs, cmdArgss, timeOut, interpreterCmd, preShellCmd)
+    return exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList
+
+############################################
+# run task functions
+# Each run of a project (a pair of stdInput and cmdArg) is an independent task, so that the runs of
+# a project with many test cases are spread over all cores instead of occupying one of them.
+# run task: (projIndex, caseIndex, stdInput, cmdArg)
+# projState: results of the runs of a project collected in the order of its cases
+
+def makeRunTasksAndProjStates(projInfos):
+    runTasks = []
+    projStates = []
+    for projIndex in range(len(projInfos)):
+        runCases = getRunCases(projInfos[projIndex]['stdInputs'], projInfos[projIndex]['cmdArgss'])
+        for caseIndex in range(len(runCases)):
+            stdInput, cmdArg = runCases[caseIndex]
+            runTasks.append((projIndex, caseIndex, stdInput, cmdArg))
+        projStates.append({'runCases':runCases, 'numFinished':0,
+                           'exitTypeList':[None]*len(runCases), 'stdoutStrList':[None]*len(runCases), 'runStatList':[None]*len(runCases)})
+    return runTasks, projStates
+
+def runOneTask(projInfo, caseIndex, stdInput, cmdArg, timeOut, interpreterCmd, preShellCmd, outputLimits, cpu=None):
+    # return exitType, stdoutStr, runStat
+    runcmd, runcwd, errorMsg = getProjRunCmdAndCwd(projInfo, interpreterCmd)
+    if errorMsg!=None:
+        return -1, errorMsg, None
+    return __run(runcmd, runcwd, stdInput, cmdArg, getCaseTimeOut(projInfo.get('timeOuts'), timeOut, caseIndex), preShellCmd, outputLimits, projInfo.get('forkServerCmd'),
+                 getExpectedOutput(projInfo.get('expectedOutputPaths'), caseIndex), cpu)
+
+def addRunTaskResult(projState, caseIndex, exitType, stdoutStr, runStat):
+    # return True if all runs of the project are finished
+    projState['exitTypeList'][caseIndex] = exitType
+    projState['stdoutStrList'][caseIndex] = stdoutStr
+    projState['runStatList'][caseIndex] = runStat
+    projState['numFinished'] += 1
+    return isProjStateFinished(projState)
+
+def isProjStateFinished(projState):
+    return projState['numFinished']==len(projState['runCases'])
+
+def getProjStateRunResult(projState):
+    # return exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList as runOneProj() does
+    stdInputList = [stdInput for stdInput, cmdArg in projState['runCases']]
+    cmdArgsList = [cmdArg for stdInput, cmdArg in projState['runCases']]
+    return projState['exitTypeList'], projState['stdoutStrList'], stdInputList, cmdArgsList, projState['runStatList']
 
-    return exitTypeList, stdoutStrList, stdInputList, cmdArgsList
+############################################
+# event loop run engine (Linux/Unix only)
+# Running target programs is mostly waiting for them, so instead of a Python process per concurrent run
+# (mp.Pool + runOneTask()), this engine runs all tasks from a single process:
+# up to numSlots target programs are in flight at once, all watched by one ProcessSupervisor,
+# and the next task is started as soon as another one finishes.
+# If runCpus is given, each slot is a CPU of runCpus, and the target program in a slot is pinned to its CPU.
+
+def runProjsInEventLoop(projInfos, timeOut, interpreterCmd, preShellCmd, outputLimits, numSlots, onProjFinished, runCpus=None):
+    # onProjFinished(index, exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList) is called
+    # when all runs of projInfos[index] are finished.
+    runTasks, projStates = makeRunTasksAndProjStates(projInfos)
+    for i in range(len(projInfos)):
+        if isProjStateFinished(projStates[i]):
+            onProjFinished(i, *getProjStateRunResult(projStates[i]))
+
+    supervisor = ProcessSupervisor()
+    waitingTasks = collections.deque(runTasks)
+    taskOfChild = {}    # child index in supervisor -> run task
+    checkerOfChild = {} # child index in supervisor -> OutputChecker or None
+    cpuOfChild = {}     # child index in supervisor -> CPU of its slot or None
+    if runCpus!=None:
+        numSlots = len(runCpus)
+        freeCpus = list(runCpus)
+
+    while len(waitingTasks) > 0 or len(taskOfChild) > 0:
+        finishedTasks = []
+
+        # fill empty slots
+        while len(taskOfChild) < numSlots and len(waitingTasks) > 0:
+            runTask = waitingTasks.popleft()
+            projIndex, caseIndex, stdInput, cmdArg = runTask
+            runcmd, runcwd, errorMsg = getProjRunCmdAndCwd(projInfos[projIndex], interpreterCmd)
+            cpu = freeCpus[0] if runCpus!=None else None
+            if errorMsg==None:
+                proc, errorMsg = startRun(runcmd, runcwd, cmdArg, preShellCmd, projInfos[projIndex].get('forkServerCmd'), cpu, stdInput)
+            if errorMsg!=None:
+                finishedTasks.append((runTask, -1, errorMsg, None))
+            else:
+                outputChecker = getOutputChecker(getExpectedOutput(projInfos[projIndex].get('expectedOutputPaths'), caseIndex))
+                childIndex = supervisor.add(proc, getStdinStr(stdInput), getCaseTimeOut(projInfos[projIndex].get('timeOuts'), timeOut, caseIndex),
+                                            outputLimits[0], outputLimits[1], outputChecker)
+                taskOfChild[childIndex] = runTask
+                checkerOfChild[childIndex] = outputChecker
+                cpuOfChild[childIndex] = cpu
+                if cpu!=None:
+                    freeCpus.remove(cpu)
+
+        if len(finishedTasks)==0:
+            for childIndex in supervisor.step(onTimeOut):
+                result = supervisor.popResult(childIndex)
+                exitType, stdoutStr, runStat = getRunResult(result, sweepRun(result), outputLimits, checkerOfChild.pop(childIndex))
+                cpu = cpuOfChild.pop(childIndex)
+                if cpu!=None:
+                    freeCpus.append(cpu)
+                finishedTasks.append((taskOfChild.pop(childIndex), exitType, stdoutStr, runStat))
+
+        for runTask, exitType, stdoutStr, runStat in finishedTasks:
+            projIndex, caseIndex = runTask[0], runTask[1]
+            if addRunTaskResult(projStates[projIndex], caseIndex, exitType, stdoutStr, runStat):
+                onProjFinished(projIndex, *getProjStateRunResult(projStates[projIndex]))
 
 ############################################
 # run functions
 
-# return exitType, output(stdout) of target program
+# return exitType, output(stdout) of target program, runStat
 # exitType:
 #   -1 - execution failed due to internal error (not supported extension, not built yet)
 #   0 - normal exit
 #   1 - forced kill due to timeout
-
-def runProj(submissionType, submissionDir, projName, projSrcFileNames, stdInputs, cmdArgss, timeOut, interpreterCmd, preShellCmd):
+# runStat:
+#   {'wallTime':seconds, 'userTime':seconds, 'sysTime':seconds, 'maxRSS':KiB, 'numStragglers':int, 'outputCheck':outputCheck}
+#   None if the target program was not executed. CPU times and maxRSS are None if unknown (Windows).
+#   numStragglers - number of processes left running by the target program after its exit, which are killed.
+#   maxRSSFloor - size of the PACERs process that has started the target program in KiB, which maxRSS
+#                 cannot go below (see supervisor.py), None if unknown or not applicable (fork server).
+#   outputCheck - result of comparing stdout with expectedOutput (see check.py), None if expectedOutput is None.
+# outputLimits:
+#   (captureSize, killSize) in bytes. only the first and last captureSize/2 bytes of stdout (and stderr)
+#   are kept, and the target program is killed when it prints more than killSize bytes (Linux/Unix only).
+#   0 means unlimited.
+# expectedOutput:
+#   the target program is killed soon after its stdout has differed from it (Linux/Unix only).
+# cpu:
+#   the target program is pinned to this CPU if it is not None (Linux only).
+# timeOuts:
+#   timeout of each run case derived from --reference, which overrides timeOut if it is not None.
+
+def runProj(runcmd, runcwd, errorMsg, stdInputs, cmdArgss, timeOut, preShellCmd, outputLimits, forkServerCmd=None, expectedOutputPaths=None, cpu=None, timeOuts=None):
     exitTypeList = []
     stdoutStrList = []
     stdInputList = []
     cmdArgsList = []
+    runStatList = []
 
-    len_std = len(stdInputs)
-    len_cmd = len(cmdArgss)
-    len_longer = len_std if len_std > len_cmd else len_cmd
-    for i in range(len_longer):
-        i_std = i if i < len_std else len_std-1
-        i_cmd = i if i < len_cmd else len_cmd-1
-        stdInput = stdInputs[i_std]
-        cmdArg = cmdArgss[i_cmd]
-
-        if submissionType==SINGLE_SOURCE_FILE or submissionType==SOURCE_FILES:
-            exitType, stdoutStr = run_single_source(submissionDir, projName, projSrcFileNames[0], stdInput, cmdArg, timeOut, interpreterCmd, preShellCmd)
-        elif submissionType==CMAKE_PROJECT:
-            exitType, stdoutStr = run_cmake(submissionDir, projName, stdInput, cmdArg, timeOut, preShellCmd)
-        elif submissionType==MAKE_PROJECT:
-            exitType, stdoutStr = run_make(submissionDir, projName, stdInput, cmdArg, timeOut, preShellCmd)
-        elif submissionType==VISUAL_CPP_PROJECT:
-            exitType, stdoutStr = run_vcxproj(submissionDir, projName, stdInput, cmdArg, timeOut, preShellCmd)
+    runCases = getRunCases(stdInputs, cmdArgss)
+    for caseIndex in range(len(runCases)):
+        stdInput, cmdArg = runCases[caseIndex]
+        if errorMsg!=None:
+            exitType, stdoutStr, runStat = -1, errorMsg, None
+        else:
+            exitType, stdoutStr, runStat = __run(runcmd, runcwd, stdInput, cmdArg, getCaseTimeOut(timeOuts, timeOut, caseIndex), preShellCmd, outputLimits, forkServerCmd,
+                                                 getExpectedOutput(expectedOutputPaths, caseIndex), cpu)
 
         exitTypeList.append(exitType)
         stdoutStrList.append(stdoutStr)
         stdInputList.append(stdInput)
         cmdArgsList.append(cmdArg)
+        runStatList.append(runStat)
 
-    return exitTypeList, stdoutStrList, stdInputList, cmdArgsList
+    return exitTypeList, stdoutStrList, stdInputList, cmdArgsList, runStatList
+
+def getRunCases(stdInputs, cmdArgss):
+    # return [(stdInput, cmdArg), ...] for all runs of a project.
+    # the shorter one of stdInputs and cmdArgss is extended by repeating its last element.
+    runCases = []
+    len_std = len(stdInputs)
+    len_cmd = len(cmdArgss)
+    len_longer = len_std if len_std > len_cmd else len_cmd
+    for i in range(len_longer):
+        i_std = i if i < len_std else len_std-1
+        i_cmd = i if i < len_cmd else len_cmd-1
+        runCases.append((stdInputs[i_std], cmdArgss[i_cmd]))
+    return runCases
+
+def getCaseTimeOut(timeOuts, timeOut, caseIndex):
+    # the last one is used for the remaining runs, as STD_INPUT and CMD_ARGS do.
+    if timeOuts==None or len(timeOuts)==0:
+        return timeOut
+    return timeOuts[min(caseIndex, len(timeOuts)-1)]
+
+# return runcmd, runcwd, errorMsg
+# errorMsg is None if the project can be run, or the reason otherwise.
+# The executable of a project is found once after the build phase by resolveRunCmdAndCwd(),
+# and all runs of the project use projInfo['runCmdAndCwd'] instead of searching it again.
+# projInfo['forkServerCmd'] is (INTERPRETER_CMD, script path) if the project is run by a python fork server.
+def resolveRunCmdAndCwd(projInfo, interpreterCmd, usePyForkServer=False):
+    projInfo['runCmdAndCwd'] = getRunCmdAndCwd(projInfo['submissionType'], projInfo['submissionDir'], projInfo['projName'], projInfo['filesInProj'], interpreterCmd)
+    projInfo['forkServerCmd'] = None
+    if usePyForkServer:
+        projInfo['forkServerCmd'] = getForkServerCmd(projInfo['submissionType'], projInfo['submissionDir'], projInfo['projName'], projInfo['filesInProj'], interpreterCmd)
+
+def getForkServerCmd(submissionType, submissionDir, projName, projSrcFileNames, interpreterCmd):
+    # return (interpreterCmd, script path) of a single python source, or None if it cannot be run by a fork server
+    if not os.path.isdir('/proc/self/fd'):
+        return None
+    if submissionType!=SINGLE_SOURCE_FILE and submissionType!=SOURCE_FILES:
+        return None
+    if os.path.splitext(projSrcFileNames[0])[1].lower()!='.py':
+        return None
+    scriptPath = runcmd_single_py(submissionDir, projName)
+    if not os.path.isfile(scriptPath):
+        return None
+    if interpreterCmd=='':
+        interpreterCmd = gSourceExt['.py']['default-interpreter-cmd']
+    return interpreterCmd, scriptPath
+
+def getProjRunCmdAndCwd(projInfo, interpreterCmd):
+    if 'runCmdAndCwd' not in projInfo:
+        resolveRunCmdAndCwd(projInfo, interpreterCmd)
+    return projInfo['runCmdAndCwd']
+
+def getRunCmdAndCwd(submissionType, submissionDir, projName, projSrcFileNames, interpreterCmd):
+    if submissionType==SINGLE_SOURCE_FILE or submissionType==SOURCE_FILES:
+        return getRunCmdAndCwd_single_source(submissionDir, projName, projSrcFileNames[0], interpreterCmd)
+    elif submissionType==CMAKE_PROJECT:
+        return runcmd_cmake(submissionDir, projName), submissionDir, None
+    elif submissionType==MAKE_PROJECT:
+        return runcmd_make(submissionDir, projName), submissionDir, None
+    elif submissionType==VISUAL_CPP_PROJECT:
+        return runcmd_vcxproj(submissionDir, projName), submissionDir, None
+    return None, None, 'Running %s is not supported.'%gSubmissionTypeName[submissionType]
 
 ####
 # run_single functions
-def run_single_source(srcRootDir, projName, singleSrcFileName, stdInput, cmdArg, timeOut, interpreterCmd, preShellCmd):
+def getRunCmdAndCwd_single_source(srcRootDir, projName, singleSrcFileName, interpreterCmd):
     extension = os.path.splitext(singleSrcFileName)[1].lower()
     if extension in gSourceExt:
         runcmd = eval(gSourceExt[extension]['runcmd-single-source-func'])(srcRootDir, projName)
@@ -86,9 +266,9 @@ def run_single_source(srcRootDir, projName, singleSrcFileName, stdInput, cmdArg,
             else:
                 pass    # c & c++
         runcwd = eval(gSourceExt[extension]['runcwd-single-source-func'])(srcRootDir, projName)
-        return __run(runcmd, runcwd, stdInput, cmdArg, timeOut, preShellCmd)
+        return runcmd, runcwd, None
     else:
-        return run_single_else(extension)
+        return None, None, 'Running %s is not supported.'%extension
 
 def runcmd_single_c_cpp(srcRootDir, projName):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
@@ -109,17 +289,8 @@ def runcwd_single_py(srcRootDir, projName):
     # run output executable from srcRootDir
     return srcRootDir
 
-def run_single_else(extension):
-    errorMsg = 'Running %s is not supported.'%extension
-    return -1, errorMsg 
-
 ####
 # run_cmake functions
-def run_cmake(srcRootDir, projName, stdInput, cmdArg, timeOut, preShellCmd):
-    runcmd = runcmd_cmake(srcRootDir, projName)
-    runcwd = srcRootDir
-    return __run(runcmd, runcwd, stdInput, cmdArg, timeOut, preShellCmd)
-
 def runcmd_cmake(srcRootDir, projName):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
     execName = projName
@@ -133,11 +304,6 @@ def runcmd_cmake(srcRootDir, projName):
 
 ####
 # run_make functions
-def run_make(srcRootDir, projName, stdInput, cmdArg, timeOut, preShellCmd):
-    runcmd = runcmd_make(srcRootDir, projName)
-    runcwd = srcRootDir
-    return __run(runcmd, runcwd, stdInput, cmdArg, timeOut, preShellCmd)
-
 def runcmd_make(srcRootDir, projName):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
     execName = projName
@@ -170,33 +336,21 @@ def runcmd_make(srcRootDir, projName):
     # IN USE NOW
     # the executable file is a file (in the build dir) that
     # 1) has an executable permission
-    # 2) has DYN or EXEC as Type: in the readelf -h output.
+    # 2) has DYN or EXEC as e_type in its ELF header (Type: in the readelf -h output).
     execCandiNames = [fname for fname in os.listdir(buildDir) if os.access(opjoin(buildDir, fname), os.X_OK) and os.path.isfile(opjoin(buildDir, fname))]
     if len(execCandiNames)==0:
         execName = 'Failed to find any file that has an executable permission in the output directory %s'%buildDir
     else:
         execName = 'Failed to find any ELF executable file in the output directory %s'%buildDir
         for execCandiName in execCandiNames:
-            try:
-                grepStr = subprocess.check_output("readelf -h %s | grep 'Type:'"%execCandiName, cwd=buildDir, stderr=subprocess.STDOUT, shell=True)
-            except subprocess.CalledProcessError as e:
-                # print e
-                # print 'Failed to execute readelf to find executable file'
-                pass
-            else: 
-                if grepStr.split()[1]=='DYN' or grepStr.spilt()[1]=='EXEC':
-                    execName = execCandiName
+            if isElfExecutable(opjoin(buildDir, execCandiName)):
+                execName = execCandiName
     ################
             
     return os.path.abspath(opjoin(buildDir, execName))
 
 ####
 # run_vcxproj functions
-def run_vcxproj(srcRootDir, projName, stdInput, cmdArg, timeOut, preShellCmd):
-    runcmd = runcmd_vcxproj(srcRootDir, projName)
-    runcwd = srcRootDir
-    return __run(runcmd, runcwd, stdInput, cmdArg, timeOut, preShellCmd)
-
 def runcmd_vcxproj(srcRootDir, projName):
     buildDir = opjoin(srcRootDir, gBuildDirPrefix+projName)
     vcxprojNames = glob.glob(opjoin(srcRootDir, '*.vcxproj'))
@@ -204,24 +358,27 @@ def runcmd_vcxproj(srcRootDir, projName):
     execName = os.path.splitext(os.path.basename(vcxprojNames[0]))[0]
     return os.path.abspath(opjoin(buildDir, execName))
 
-def __run(runcmd, runcwd, stdInput, cmdArg, timeOut, preShellCmd):
-    # append newline to finish stdin user input and flush input buffer
-    realStdInput = stdInput+'\n'
+def __run(runcmd, runcwd, stdInput, cmdArg, timeOut, preShellCmd, outputLimits, forkServerCmd=None, expectedOutput=None, cpu=None):
+    realStdInput = getStdinStr(stdInput)
 
-    try:
-        if preShellCmd!='':
-            if os.name=='posix':
-                shell = '/bin/bash -c'
-                connector = ';'
-            else:
-                shell = 'cmd /c'
-                connector = '&'
-            runcmd = '%s %s %s %s'%(shell, preShellCmd, connector, runcmd)
+    proc, errorMsg = startRun(runcmd, runcwd, cmdArg, preShellCmd, forkServerCmd, cpu, stdInput)
+    if proc==None:
+        return -1, errorMsg, None
 
-        proc = subprocess.Popen(shlex.split(toString(runcmd)+' '+toString(cmdArg), posix=os.name=='posix'), cwd=toString(runcwd), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
-    except OSError:
-        return -1, 'Cannot execute \'%s\' \n(Maybe an executable file has not been created (compiled languages) or \n--interpreter-cmd should have been specified (interpreted languages))'%runcmd
+    if os.name=='posix':
+        # the supervisor kills proc at its deadline and measures its elapsed time without a timer thread
+        supervisor = ProcessSupervisor()
+        outputChecker = getOutputChecker(expectedOutput)
+        supervisor.add(proc, realStdInput, timeOut, outputLimits[0], outputLimits[1], outputChecker)
+        try:
+            result = supervisor.run(onTimeOut)[0]
+        except Exception as e:
+            killProcessGroup(proc.pid)
+            return -1, toUnicode(str(type(e)) + ' ' + str(e)), None
+        return getRunResult(result, sweepRun(result), outputLimits, outputChecker)
 
+    # windows specific - only the wall time can be measured
+    startTime = proc.startTime
     if timeOut != 0:
         # call onTimeOut() after timeOut seconds
         timer = threading.Timer(timeOut, onTimeOut, [proc])
@@ -231,27 +388,133 @@ def __run(runcmd, runcwd, stdInput, cmdArg, timeOut, preShellCmd):
         try:
             stdoutStr, stderrStr = proc.communicate(realStdInput)
         except Exception as e:
-            return -1, toUnicode(str(type(e)) + ' ' + str(e))
+            return -1, toUnicode(str(type(e)) + ' ' + str(e)), None
+        runStat = getRunStat(time.time()-startTime)
+        if expectedOutput!=None:
+            runStat['outputCheck'] = checkOutput(expectedOutput, stdoutStr)
+        stdoutStr, stderrStr = capOutput(stdoutStr, outputLimits), capOutput(stderrStr, outputLimits)
 
         if timer.is_alive():    # if proc has finished without calling onTimeOut() (finished before timeOut)
             timer.cancel()
             if proc.returncode==0:
-                return 0, toUnicode(stdoutStr)
+                return 0, toUnicode(stdoutStr), runStat
             else:
-                return -1, toUnicode(stdoutStr) + toUnicode(stderrStr)
+                return -1, toUnicode(stdoutStr) + toUnicode(stderrStr), runStat
         else:
-            return 1, toUnicode(stdoutStr) # 1 means 'forced kill due to timeout'
+            return 1, toUnicode(stdoutStr), runStat # 1 means 'forced kill due to timeout'
     else:
         # block until proc is finished
         stdoutStr, stderrStr = proc.communicate(realStdInput)
+        runStat = getRunStat(time.time()-startTime)
+        if expectedOutput!=None:
+            runStat['outputCheck'] = checkOutput(expectedOutput, stdoutStr)
+        stdoutStr, stderrStr = capOutput(stdoutStr, outputLimits), capOutput(stderrStr, outputLimits)
         if proc.returncode==0:
-            return 0, toUnicode(stdoutStr)
+            return 0, toUnicode(stdoutStr), runStat
         else:
-            return -1, toUnicode(stdoutStr) + toUnicode(stderrStr)
+            return -1, toUnicode(stdoutStr) + toUnicode(stderrStr), runStat
+
+def startRun(runcmd, runcwd, cmdArg, preShellCmd, forkServerCmd=None, cpu=None, stdInput=None):
+    # return proc, None or None, errorMsg if runcmd cannot be executed.
+    # the stdin of proc is the file of stdInput if it is a StdInputFile, or a pipe otherwise.
+    # proc.startTime is the time before proc is spawned, from which its wall time is measured,
+    # so that the wall time includes fork() and exec() as for a program started from a shell.
+    startTime = time.time()
+    if forkServerCmd!=None and preShellCmd=='':
+        interpreterCmd, scriptPath = forkServerCmd
+        try:
+            proc = startForkServerRun(interpreterCmd, scriptPath, cmdArg, runcwd, stdInput.path if isStdInputFile(stdInput) else None)
+            if cpu!=None:
+                # the child has been forked on the CPU of the fork server
+                setCpuAffinity(proc.pid, [cpu])
+            proc.startTime = startTime
+            return proc, None
+        except ForkServerError:
+            # run it as usual
+            pass
+
+    try:
+        if preShellCmd!='':
+            if os.name=='posix':
+                shell = '/bin/bash -c'
+                connector = ';'
+            else:
+                shell = 'cmd /c'
+                connector = '&'
+            runcmd = '%s %s %s %s'%(shell, preShellCmd, connector, runcmd)
+
+        stdin = openStdInputFile(stdInput) if isStdInputFile(stdInput) else subprocess.PIPE
+        try:
+            if os.name=='posix':
+                # run in a new session and process group, so that onTimeOut() and sweepRun() can kill
+                # the target program together with all processes it has started (shell of --pre-shell-cmd, fork(), ...)
+                maxRSSFloor = getProcessRSS()
+                proc = subprocess.Popen(shlex.split(toString(runcmd)+' '+toString(cmdArg)), cwd=toString(runcwd), stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False, preexec_fn=getRunPreexecFn(cpu))
+                proc.maxRSSFloor = maxRSSFloor
+            else:
+                proc = subprocess.Popen(shlex.split(toString(runcmd)+' '+toString(cmdArg), posix=False), cwd=toString(runcwd), stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
+        finally:
+            if stdin!=subprocess.PIPE:
+                stdin.close()
+    except (OSError, IOError):
+        return None, 'Cannot execute \'%s\' \n(Maybe an executable file has not been created (compiled languages) or \n--interpreter-cmd should have been specified (interpreted languages))'%runcmd
+    proc.startTime = startTime
+    return proc, None
+
+def getStdinStr(stdInput):
+    # the string written to the stdin pipe, None if stdin is a file
+    if isStdInputFile(stdInput):
+        return None
+    # append newline to finish stdin user input and flush input buffer
+    return stdInput+'\n'
+
+def getRunPreexecFn(cpu):
+    if cpu==None:
+        return os.setsid
+    def preexecFn():
+        os.setsid()
+        setCpuAffinity(0, [cpu])
+    return preexecFn
+
+def sweepRun(result):
+    # kill the processes left in the process group of a finished run.
+    # return the number of stragglers including the ones the supervisor has killed to reap the run,
+    # which is 0 for killed runs as their whole group has been killed already.
+    numStragglers = result['numStragglers'] + sweepProcessGroup(result['pid'])
+    if result['timedOut'] or result['outputExceeded'] or result['outputDiverged']:
+        return 0
+    return numStragglers
+
+def getRunResult(result, numStragglers, outputLimits, outputChecker=None):
+    # return exitType, stdoutStr, runStat from the supervisor result of a run
+    runStat = getRunStat(result['elapsed'], result['userTime'], result['sysTime'], result['maxRSS'], numStragglers, result['maxRSSFloor'])
+    if outputChecker!=None:
+        runStat['outputCheck'] = outputChecker.getOutputCheck()
+    if result['outputExceeded']:
+        return -1, toUnicode(result['stdoutStr']) + toUnicode(result['stderrStr']) + '\n' + gOutputLimitMsg%(outputLimits[1]/1024), runStat
+    elif result['outputDiverged']:
+        return -1, toUnicode(result['stdoutStr']) + toUnicode(result['stderrStr']) + '\n' + gOutputDivergedMsg, runStat
+    elif result['timedOut']:
+        return 1, toUnicode(result['stdoutStr']), runStat # 1 means 'forced kill due to timeout'
+    elif result['returncode']==0:
+        return 0, toUnicode(result['stdoutStr']), runStat
+    else:
+        return -1, toUnicode(result['stdoutStr']) + toUnicode(result['stderrStr']), runStat
+
+def capOutput(outputStr, outputLimits):
+    # keep the first and last bytes of outputStr as the supervisor does.
+    # windows specific - the whole output is read by communicate() anyway.
+    capture = OutputCapture(outputLimits[0])
+    capture.add(outputStr)
+    return capture.getStr()
+
+def getRunStat(wallTime, userTime=None, sysTime=None, maxRSS=None, numStragglers=0, maxRSSFloor=None):
+    return {'wallTime':wallTime, 'userTime':userTime, 'sysTime':sysTime, 'maxRSS':maxRSS, 'numStragglers':numStragglers, 'outputCheck':None,
+            'maxRSSFloor':maxRSSFloor}
 
 def onTimeOut(proc):
     if os.name=='posix':
-        proc.kill()
+        killProcessGroup(proc.pid)
     else:
         # windows specific - to kill both cmd.exe and its subprocess (required when --pre-shell-cmd is specified)
         # http://stackoverflow.com/questions/4789837/how-to-terminate-a-python-subprocess-launched-with-shell-true
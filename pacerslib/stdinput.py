@@ -0,0 +1,81 @@
+################################################################################
+# stdinput.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os
+from unicode import *
+from supervisor import *
+
+############################################
+# file-backed stdin functions
+# An element of STD_INPUT (stdInput) is a string, or a StdInputFile for --std-input-file and --std-input-dir.
+# The stdin of a target program run with a StdInputFile is the file itself opened read-only,
+# so its contents are never read, copied or pickled by PACERs.
+
+# bytes of an input file shown in logs and the report
+gStdInputPreviewSize = 100
+
+class StdInputFile(object):
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    def __eq__(self, other):
+        return isinstance(other, StdInputFile) and self.path==other.path
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return 'StdInputFile(%s)'%repr(self.path)
+
+def loadStdInputFiles(paths, dirPath):
+    # return a list of StdInputFile for --std-input-file paths or all files in --std-input-dir dirPath
+    # (in the order of their names, used if it is not None), errorMsg
+    if dirPath!=None:
+        if not os.path.isdir(dirPath):
+            return None, 'Unable to access \'%s\'.'%dirPath
+        paths = [opjoin(dirPath, name) for name in sorted(os.listdir(dirPath)) if os.path.isfile(opjoin(dirPath, name))]
+        if len(paths)==0:
+            return None, 'No input file in \'%s\'.'%dirPath
+    for path in paths:
+        if not os.path.isfile(path):
+            return None, 'Unable to access \'%s\'.'%path
+    return [StdInputFile(path) for path in paths], None
+
+def isStdInputFile(stdInput):
+    return isinstance(stdInput, StdInputFile)
+
+def openStdInputFile(stdInput):
+    return open(toString(stdInput.path), 'rb')
+
+def getStdInputDisplayStr(stdInput):
+    # the file name, size and the first gStdInputPreviewSize bytes of a StdInputFile, or stdInput itself
+    if not isStdInputFile(stdInput):
+        return stdInput
+    try:
+        size = os.path.getsize(stdInput.path)
+        with openStdInputFile(stdInput) as f:
+            preview = f.read(gStdInputPreviewSize)
+        preview = toUnicode(preview[:getUtf8HeadEnd(preview)])
+    except (IOError, OSError):
+        return u'%s (unable to read)'%os.path.basename(stdInput.path)
+    if size > gStdInputPreviewSize:
+        preview += u'...'
+    return u'%s (%d bytes)\n%s'%(os.path.basename(stdInput.path), size, preview)
@@ -0,0 +1,431 @@
+################################################################################
+# supervisor.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, sys, time, heapq, select, errno, signal, collections
+if os.name=='posix':
+    import fcntl
+
+############################################
+# process supervisor (Linux/Unix only)
+# A supervisor watches any number of child processes in one loop, without a thread per child.
+# It feeds their stdin and collects their stdout and stderr with a single select() call,
+# and kills each child when its deadline is reached. Deadlines are kept in a heap,
+# so the select() timeout is always the time left until the nearest deadline.
+# Each child must lead its own process group (started with setsid): a child that exits while processes it
+# has started still hold its stdout or stderr is reaped anyway, and those processes are killed with its group.
+#
+# result of each child:
+#   {'pid':int, 'returncode':int or None, 'stdoutStr':str, 'stderrStr':str, 'timedOut':bool, 'outputExceeded':bool,
+#    'outputDiverged':bool, 'elapsed':float, 'userTime':float or None, 'sysTime':float or None, 'maxRSS':int or None,
+#    'maxRSSFloor':int or None}
+#   stdoutStr, stderrStr - output captured by OutputCapture, so at most captureSize bytes of each plus a marker.
+#   outputExceeded - True if the child was killed because it printed more than killSize bytes.
+#   outputDiverged - True if the child was killed because outputChecker.shouldStop() became True.
+#   elapsed - seconds from add() to the exit of the child, or to the kill of the child if timedOut or outputExceeded.
+#   numStragglers - number of processes killed in the process group of the child when it exited
+#                   while they still held its stdout or stderr (see sweepProcessGroup()).
+#   userTime, sysTime - CPU seconds used by the child, maxRSS - peak resident set size of the child in KiB.
+#   They are read from the rusage of os.wait4() when the child is reaped, and are None if it is unavailable.
+#   maxRSS also counts the memory of the forked python process before it executes the target program,
+#   so it is at least about the size of the process that has started the child.
+#   maxRSSFloor - that size (proc.maxRSSFloor, see getProcessRSS()) in KiB, None if unknown.
+#   maxRSS not larger than maxRSSFloor means the peak of the target program itself is not known but not larger.
+
+# after killing a child, wait this long for the pipes to be closed by its remaining subprocesses
+gKillDrainTime = .5
+
+# interval of polling the exit of a child that has closed its stdout and stderr
+gMinReapInterval = .001
+gMaxReapInterval = .01
+
+# interval of polling the exit of a child whose stdout or stderr is still open
+gLeaderPollInterval = .05
+
+class ProcessSupervisor(object):
+    def __init__(self):
+        self.children = {}      # child index -> child
+        self.numAdded = 0
+        self.deadlines = []     # heap of (deadline, child index)
+
+    def add(self, proc, stdinStr, timeOut, captureSize=0, killSize=0, outputChecker=None):
+        # proc must be started with stdin, stdout and stderr of subprocess.PIPE.
+        # the wall time of proc is measured from proc.startTime if it has one, or from now.
+        # timeOut 0 means no time limit.
+        # captureSize - bytes of stdout and of stderr to be kept. 0 means all output is kept.
+        # killSize - the child is killed when its stdout and stderr exceed this many bytes in total. 0 means no limit.
+        # outputChecker - an object that is given all stdout by add(data) and kills the child when its shouldStop() is True.
+        # return the index of the child, which is the index of its result in the list returned by run().
+        child = {'proc':proc, 'startTime':getattr(proc, 'startTime', time.time()), 'stdinStr':stdinStr, 'stdinOffset':0,
+                 'stdout':OutputCapture(captureSize), 'stderr':OutputCapture(captureSize), 'killSize':killSize,
+                 'outputChecker':outputChecker, 'timedOut':False, 'outputExceeded':False, 'outputDiverged':False, 'endTime':None,
+                 'drainDeadline':None, 'reapInterval':gMinReapInterval, 'rusage':None, 'numStragglers':0, 'done':False}
+
+        child['fds'] = {}
+        if proc.stdin!=None:
+            if len(stdinStr) > 0:
+                setNonBlocking(proc.stdin.fileno())
+                child['fds'][proc.stdin.fileno()] = 'stdin'
+            else:
+                proc.stdin.close()
+        child['fds'][proc.stdout.fileno()] = 'stdout'
+        child['fds'][proc.stderr.fileno()] = 'stderr'
+
+        index = self.numAdded
+        self.numAdded += 1
+        self.children[index] = child
+        if timeOut != 0:
+            heapq.heappush(self.deadlines, (child['startTime']+timeOut, index))
+        return index
+
+    def run(self, onKill):
+        # block until all children exit or are killed by onKill(proc) at their deadlines.
+        # return the list of results.
+        while self.getNumActive() > 0:
+            self.step(onKill)
+        return [self.popResult(index) for index in sorted(self.children)]
+
+    def getNumActive(self):
+        return len([child for child in self.children.values() if not child['done']])
+
+    def step(self, onKill):
+        # wait for the next event (output, exit or deadline of any child) and handle it.
+        # return the indices of children that have finished in this step.
+        now = time.time()
+        self.__killExpired(now, onKill)
+        finished = self.__reapExited(now)
+        if len(finished) > 0:
+            return finished
+
+        active = [child for child in self.children.values() if not child['done']]
+        if len(active)==0:
+            return finished
+
+        rlist = []
+        wlist = []
+        waitTime = None
+        for child in active:
+            for fd, name in child['fds'].items():
+                if name=='stdin':
+                    wlist.append(fd)
+                else:
+                    rlist.append(fd)
+            if len(self.__getOutputFds(child))==0:
+                waitTime = minTime(waitTime, child['reapInterval'])
+            elif child['endTime']==None:
+                waitTime = minTime(waitTime, gLeaderPollInterval)
+            if child['drainDeadline']!=None:
+                waitTime = minTime(waitTime, child['drainDeadline']-now)
+        if len(self.deadlines) > 0:
+            waitTime = minTime(waitTime, self.deadlines[0][0]-now)
+        if waitTime!=None:
+            waitTime = max(waitTime, 0.)
+
+        try:
+            readable, writable, temp = select.select(rlist, wlist, [], waitTime)
+        except select.error as e:
+            if e.args[0]==errno.EINTR:
+                return finished
+            raise
+
+        for child in active:
+            for fd in writable:
+                if child['fds'].get(fd)=='stdin':
+                    self.__writeStdin(child, fd)
+            for fd in readable:
+                if fd in child['fds']:
+                    self.__readOutput(child, fd)
+            if child['killSize'] > 0 and child['endTime']==None and \
+                    child['stdout'].totalSize + child['stderr'].totalSize > child['killSize']:
+                self.__kill(child, time.time(), onKill)
+                child['outputExceeded'] = True
+            if child['outputChecker']!=None and child['endTime']==None and child['outputChecker'].shouldStop():
+                self.__kill(child, time.time(), onKill)
+                child['outputDiverged'] = True
+        return finished
+
+    def popResult(self, index):
+        # return the result of a finished child and forget the child
+        child = self.children.pop(index)
+        return {'pid':child['proc'].pid,
+                'returncode':child['proc'].returncode,
+                'stdoutStr':child['stdout'].getStr(),
+                'stderrStr':child['stderr'].getStr(),
+                'timedOut':child['timedOut'],
+                'outputExceeded':child['outputExceeded'],
+                'outputDiverged':child['outputDiverged'],
+                'numStragglers':child['numStragglers'],
+                'elapsed':child['endTime']-child['startTime'],
+                'userTime':getattr(child['rusage'], 'ru_utime', None),
+                'sysTime':getattr(child['rusage'], 'ru_stime', None),
+                'maxRSS':getRUsageMaxRSS(child['rusage']),
+                'maxRSSFloor':getattr(child['proc'], 'maxRSSFloor', None)}
+
+    def __killExpired(self, now, onKill):
+        while len(self.deadlines) > 0 and self.deadlines[0][0] <= now:
+            deadline, index = heapq.heappop(self.deadlines)
+            child = self.children.get(index)
+            if child==None or child['done'] or child['endTime']!=None:
+                continue
+            self.__kill(child, now, onKill)
+            child['timedOut'] = True
+
+    def __kill(self, child, now, onKill):
+        onKill(child['proc'])
+        child['endTime'] = now
+        child['drainDeadline'] = now + gKillDrainTime
+
+    def __reapExited(self, now):
+        finished = []
+        for index, child in self.children.items():
+            if child['done']:
+                continue
+            if child['drainDeadline']!=None and now >= child['drainDeadline']:
+                # give up the output of subprocesses that survived the kill
+                self.__closeAll(child)
+            if len(self.__getOutputFds(child))==0:
+                if self.__wait(child):
+                    self.__closeAll(child)
+                    if child['endTime']==None:
+                        child['endTime'] = now
+                    child['done'] = True
+                    finished.append(index)
+                else:
+                    child['reapInterval'] = min(child['reapInterval']*2, gMaxReapInterval)
+            elif child['endTime']==None and self.__wait(child):
+                # the child has exited, but processes it has started still hold its pipes.
+                # kill them and read what is left in the pipes.
+                child['endTime'] = now
+                child['numStragglers'] = sweepProcessGroup(child['proc'].pid)
+                child['drainDeadline'] = now + gKillDrainTime
+        return finished
+
+    def __wait(self, child):
+        # reap the child without blocking and keep its rusage. return True if it has exited.
+        proc = child['proc']
+        if proc.returncode!=None:
+            return True
+        try:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        except OSError as e:
+            if e.errno==errno.EINTR:
+                return False
+            if e.errno!=errno.ECHILD:
+                raise
+            # not a child of this process (e.g. a child of a fork server) or already reaped by someone else
+            if proc.poll()==None:
+                return False
+            child['rusage'] = getattr(proc, 'rusage', None)
+            return True
+        if pid==0:
+            return False
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+        child['rusage'] = rusage
+        return True
+
+    def __writeStdin(self, child, fd):
+        data = child['stdinStr'][child['stdinOffset']:child['stdinOffset']+select.PIPE_BUF]
+        try:
+            child['stdinOffset'] += os.write(fd, data)
+        except OSError as e:
+            if e.errno==errno.EAGAIN or e.errno==errno.EINTR:
+                return
+            if e.errno!=errno.EPIPE:
+                raise
+            # the child does not read stdin any more
+            child['stdinOffset'] = len(child['stdinStr'])
+        if child['stdinOffset'] >= len(child['stdinStr']):
+            self.__closeFd(child, fd)
+
+    def __readOutput(self, child, fd):
+        try:
+            data = os.read(fd, 1<<16)
+        except OSError as e:
+            if e.errno==errno.EAGAIN or e.errno==errno.EINTR:
+                return
+            raise
+        if not data:
+            self.__closeFd(child, fd)
+        else:
+            child[child['fds'][fd]].add(data)
+            if child['fds'][fd]=='stdout' and child['outputChecker']!=None:
+                child['outputChecker'].add(data)
+
+    def __getOutputFds(self, child):
+        return [fd for fd, name in child['fds'].items() if name!='stdin']
+
+    def __closeFd(self, child, fd):
+        name = child['fds'].pop(fd)
+        getattr(child['proc'], name).close()
+
+    def __closeAll(self, child):
+        for fd in child['fds'].keys():
+            self.__closeFd(child, fd)
+
+############################################
+# bounded output capture
+# A program stuck in a printf loop can print gigabytes before its timeout.
+# OutputCapture keeps only the first and the last captureSize/2 bytes of a stream while counting all bytes,
+# so the memory of PACERs and the size of the report are bounded regardless of the output of programs.
+# The omitted middle part is replaced with a marker that has the number of omitted and total bytes.
+
+gOutputOmittedMarker = '\n\n... (%d bytes omitted, %d bytes in total) ...\n\n'
+
+class OutputCapture(object):
+    def __init__(self, captureSize=0):
+        self.captureSize = captureSize     # 0 means unlimited
+        self.headChunks = []
+        self.headSize = 0
+        self.tailChunks = collections.deque()
+        self.tailSize = 0
+        self.totalSize = 0
+
+    def add(self, data):
+        self.totalSize += len(data)
+        if self.captureSize==0:
+            self.headChunks.append(data)
+            return
+
+        headLimit = self.captureSize - self.captureSize/2
+        if self.headSize < headLimit:
+            headData = data[:headLimit-self.headSize]
+            self.headChunks.append(headData)
+            self.headSize += len(headData)
+            data = data[len(headData):]
+            if not data:
+                return
+
+        tailLimit = self.captureSize/2
+        self.tailChunks.append(data)
+        self.tailSize += len(data)
+        while self.tailSize - len(self.tailChunks[0]) >= tailLimit:
+            self.tailSize -= len(self.tailChunks.popleft())
+
+    def getStr(self):
+        head = ''.join(self.headChunks)
+        tail = ''.join(self.tailChunks)
+        if self.captureSize==0 or self.totalSize <= self.captureSize:
+            return head + tail
+        tail = tail[len(tail)-self.captureSize/2:]
+        # do not split multibyte utf-8 characters at the cut points
+        head = head[:getUtf8HeadEnd(head)]
+        tail = tail[getUtf8TailStart(tail):]
+        return head + gOutputOmittedMarker%(self.totalSize-len(head)-len(tail), self.totalSize) + tail
+
+def getUtf8HeadEnd(head):
+    # return the length of head without a utf-8 character cut at its end
+    for i in range(len(head)-1, max(len(head)-4, -1), -1):
+        c = ord(head[i])
+        if c < 0x80:
+            break
+        if c >= 0xc0:
+            if c >= 0xf0:
+                charLen = 4
+            elif c >= 0xe0:
+                charLen = 3
+            else:
+                charLen = 2
+            if i + charLen > len(head):
+                return i
+            break
+    return len(head)
+
+def getUtf8TailStart(tail):
+    # return the index of the first byte of tail that does not continue a cut utf-8 character
+    i = 0
+    while i < min(len(tail), 3) and 0x80 <= ord(tail[i]) < 0xc0:
+        i += 1
+    return i
+
+############################################
+# process group functions (Linux/Unix only)
+# A process started with preexec_fn=os.setsid leads a new session and process group whose id is its pid,
+# and all processes it forks stay in that group unless they call setsid() themselves.
+# So the group can be killed as a whole, and processes left in the group after the leader has exited
+# (stragglers, e.g. background processes of a shell script) can be found and killed.
+
+def killProcessGroup(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def getProcessGroupMembers(pgid):
+    # return pids of live processes in the process group pgid, or None if /proc is not available
+    if not os.path.isdir('/proc/self'):
+        return None
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat'%name, 'r') as f:
+                stat = f.read()
+        except (IOError, OSError):
+            continue
+        # fields after the command name (in parentheses): state ppid pgrp ...
+        fields = stat[stat.rfind(')')+1:].split()
+        if len(fields) >= 3 and int(fields[2])==pgid and fields[0]!='Z':
+            pids.append(int(name))
+    return pids
+
+def sweepProcessGroup(pgid):
+    # kill all processes left in the process group pgid.
+    # return the number of killed processes (1 if it cannot be counted without /proc).
+    # the group is usually empty, so probe it before scanning all processes in /proc
+    try:
+        os.killpg(pgid, 0)
+    except OSError as e:
+        if e.errno==errno.ESRCH:
+            return 0
+    members = getProcessGroupMembers(pgid)
+    if members==None:
+        members = [pgid]
+    if len(members) > 0:
+        killProcessGroup(pgid)
+    return len(members)
+
+def getRUsageMaxRSS(rusage):
+    # ru_maxrss is in KiB on Linux and in bytes on Mac OS X
+    if rusage==None:
+        return None
+    if sys.platform=='darwin':
+        return rusage.ru_maxrss/1024
+    return rusage.ru_maxrss
+
+def getProcessRSS(pid='self'):
+    # return VmRSS of the process pid in KiB, or None if /proc is not available
+    try:
+        with open('/proc/%s/status'%pid, 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+def minTime(t1, t2):
+    if t1==None:
+        return t2
+    return min(t1, t2)
+
+def setNonBlocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
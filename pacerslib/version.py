@@ -84,6 +84,25 @@ def getMakeVersionPosix(temp1, temp2):
 
     return versionStrs
 
+def getCompilerVersionPosix(cCompilerCmd, cppCompilerCmd):
+    versionStrs = []
+    # c compiler
+    try: versionStr = toUnicode(subprocess.check_output('%s --version'%cCompilerCmd, stderr=subprocess.STDOUT, shell=True))
+    except subprocess.CalledProcessError as e: versionStrs.append(e.output)
+    else: versionStrs.append(versionStr.split(os.linesep)[0])
+
+    # c++ compiler
+    try: versionStr = toUnicode(subprocess.check_output('%s --version'%cppCompilerCmd, stderr=subprocess.STDOUT, shell=True))
+    except subprocess.CalledProcessError as e: versionStrs.append(e.output)
+    else: versionStrs.append(versionStr.split(os.linesep)[0])
+
+    return versionStrs
+
+def getNinjaVersion():
+    try: versionStr = toUnicode(subprocess.check_output('ninja --version', stderr=subprocess.STDOUT, shell=True))
+    except subprocess.CalledProcessError as e: return toUnicode(e.output)
+    else: return u'ninja %s'%versionStr.split(os.linesep)[0]
+
 def getMakeVersionWindows(temp1, temp2):
     versionStrs = []
     return versionStrs
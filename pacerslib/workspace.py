@@ -0,0 +1,95 @@
+################################################################################
+# workspace.py
+
+# Copyright (C) 2016-2017 Yoonsang Lee
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+import os, shutil, tempfile, fnmatch
+from unicode import *
+
+############################################
+# tmpfs workspace functions
+# The workspace is the directory where submissions are copied, built and run
+# (<OUTPUT_DIR>/<ASSIGNMENT_ALIAS>/ by default).
+# With --workspace tmpfs, it is a temporary directory in a RAM-backed file system (WORKSPACE_DIR),
+# which is removed when PACERs exits. Only the report, its resources and
+# the files matching --keep-files are written to <OUTPUT_DIR>/<ASSIGNMENT_ALIAS>/.
+
+# copies of submissions, CMake build dirs and build outputs usually take a few times
+# the size of the submissions.
+gWorkspaceSizeFactor = 4
+
+def getDirSize(dirPath):
+    size = 0
+    for root, dirs, files in os.walk(toString(dirPath)):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+def getFreeSpace(dirPath):
+    st = os.statvfs(toString(dirPath))
+    return st.f_bavail * st.f_frsize
+
+def createTmpfsWorkspace(tmpfsDir, assignmentDir, budget):
+    # return the path of a new temporary workspace in tmpfsDir, errorMsg.
+    # budget - the maximum size in bytes the workspace may take, 0 means the free space of tmpfsDir.
+    if os.name!='posix' or not os.path.isdir(tmpfsDir):
+        return None, 'Unable to access \'%s\'.'%tmpfsDir
+
+    requiredSize = getDirSize(assignmentDir) * gWorkspaceSizeFactor
+    freeSpace = getFreeSpace(tmpfsDir)
+    if budget==0 or budget > freeSpace:
+        budget = freeSpace
+    if requiredSize > budget:
+        return None, 'The workspace may need %d MiB, but only %d MiB is available in \'%s\'.'%(requiredSize/(1<<20), budget/(1<<20), tmpfsDir)
+
+    return toUnicode(tempfile.mkdtemp(prefix='pacers-', dir=toString(tmpfsDir))), None
+
+def removeWorkspace(workspaceDir):
+    shutil.rmtree(toString(workspaceDir), ignore_errors=True)
+
+def matchPathPattern(relPath, pattern):
+    # fnmatch for each path component, so that * and ? do not match os.sep as in shell globs
+    pathTokens = relPath.split(os.sep)
+    patternTokens = pattern.split('/')
+    if len(pathTokens)!=len(patternTokens):
+        return False
+    for pathToken, patternToken in zip(pathTokens, patternTokens):
+        if not fnmatch.fnmatch(pathToken, patternToken):
+            return False
+    return True
+
+def keepWorkspaceFiles(workspaceDestDir, outputDestDir, keepPatterns):
+    # copy files in workspaceDestDir whose relative paths match any of keepPatterns to the same paths in outputDestDir.
+    # return the number of copied files.
+    # paths are byte strings as in the other os.walk() loops of PACERs
+    numCopied = 0
+    srcRootDir = toString(workspaceDestDir)
+    for root, dirs, files in os.walk(srcRootDir):
+        for name in files:
+            srcPath = os.path.join(root, name)
+            relPath = srcPath.replace(srcRootDir+os.sep, '')
+            for pattern in keepPatterns:
+                if matchPathPattern(relPath, toString(pattern)):
+                    dstPath = os.path.join(toString(outputDestDir), relPath)
+                    if not os.path.isdir(os.path.dirname(dstPath)):
+                        os.makedirs(os.path.dirname(dstPath))
+                    shutil.copy2(srcPath, dstPath)
+                    numCopied += 1
+                    break
+    return numCopied
@@ -0,0 +1,12 @@
+#include <stdio.h>
+#include <unistd.h>
+int main()
+{
+    printf("done\n");
+    fflush(stdout);
+
+    // the child keeps stdout and stderr of this program open after it exits
+    if(fork()==0)
+        execlp("sleep", "sleep", "30", (char*)NULL);
+    return 0;
+}